@@ -4,7 +4,10 @@ APP_CONFIG = {
     "page_title": "Complete Media Converter Suite",
     "page_icon": "🎵",
     "max_file_size": 10 * 1024**3,  # 10GB in bytes
+    "in_memory_max_size": 100 * 1024**2,  # Uploads up to 100MB are converted without an output file
     "temp_dir_prefix": "media_converter_",
+    "tmpfs_dir": "/dev/shm",  # RAM-backed scratch space, used when present and writable
+    "tmpfs_max_size": 100 * 1024**2,  # Temporary copies up to 100MB go to tmpfs instead of disk
     "version": "1.0.0"
 }
 
@@ -32,10 +35,13 @@ QUALITY_PRESETS = {
         "high": {"crf": "18", "preset": "slow"}
     },
     "compression": {
-        "light": {"crf": "20", "preset": "slow"},
-        "medium": {"crf": "25", "preset": "medium"},
-        "heavy": {"crf": "30", "preset": "fast"},
-        "maximum": {"crf": "35", "preset": "faster"}
+        # Interactive tiers use fast x264 presets, with CRF nudged up a step
+        # to hold file size; "archival" keeps the slow preset for best density
+        "light": {"crf": "21", "preset": "veryfast"},
+        "medium": {"crf": "26", "preset": "veryfast"},
+        "heavy": {"crf": "30", "preset": "faster"},
+        "maximum": {"crf": "35", "preset": "faster"},
+        "archival": {"crf": "20", "preset": "slow"}
     }
 }
 
@@ -78,18 +84,30 @@ YT_DLP_OPTIONS = {
         'extract_flat': False,
         'quiet': False,
         'no_warnings': False,
+        # Fetch DASH/HLS fragments in parallel; progressive downloads are
+        # requested in 10MB ranges
+        'concurrent_fragment_downloads': 8,
+        'http_chunk_size': 10 * 1024**2,
+        # Give up on stalled sockets sooner so yt-dlp's retries reconnect
+        'socket_timeout': 15,
         'http_headers': {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'en-us,en;q=0.5',
-            'Accept-Encoding': 'gzip,deflate',
             'DNT': '1',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         }
     },
+    "aria2c": {
+        # Progressive (single-file) downloads split across parallel
+        # connections when aria2c is installed; fragments stay with yt-dlp
+        'external_downloader': {'http': 'aria2c'},
+        'external_downloader_args': {'aria2c': ['-x', '8', '-s', '8', '-k', '1M']}
+    },
     "audio": {
-        'format': 'bestaudio/best',
+        # Audio-only DASH streams; never fall back to a muxed video download
+        'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio',
         'postprocessors': [{
             'key': 'FFmpegExtractAudio',
             'preferredcodec': 'mp3',
@@ -0,0 +1,104 @@
+import math
+import os
+import random
+import struct
+import tempfile
+import unittest
+import wave
+
+from utils.ffmped_utils import (
+    lameenc, build_audio_command, encode_wav_to_mp3, mp3_frame_length, MP3_FRAME_BITRATES, MP3_VBR_QUALITY
+)
+
+
+def write_test_wav(path: str, seconds: int = 3, sample_rate: int = 44100) -> None:
+    """Write a 16-bit stereo WAV of tones and noise, which LAME cannot squeeze into a few bits"""
+    rng = random.Random(0)
+    samples = bytearray()
+    for i in range(seconds * sample_rate):
+        left = 8000 * math.sin(i * 0.05) + rng.randint(-3000, 3000)
+        right = 8000 * math.sin(i * 0.07) + rng.randint(-3000, 3000)
+        samples += struct.pack('<hh', int(left), int(right))
+
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(samples))
+
+
+def read_frame_bitrates(data: bytes) -> list:
+    """Bitrate (kbps) of each MPEG-1 Layer III frame in data"""
+    bitrates = []
+    offset = 0
+    while offset < len(data):
+        frame_length = mp3_frame_length(data[offset:offset + 4])
+        if not frame_length:
+            break
+        bitrates.append(MP3_FRAME_BITRATES[1][data[offset + 2] >> 4])
+        offset += frame_length
+    return bitrates
+
+
+@unittest.skipIf(lameenc is None, "lameenc is not installed")
+class EncodeWavToMp3Test(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.wav_path = os.path.join(self.temp_dir.name, "input.wav")
+        write_test_wav(self.wav_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def encode(self, quality: str) -> bytes:
+        output_path = os.path.join(self.temp_dir.name, f"{quality}.mp3")
+        self.assertTrue(encode_wav_to_mp3(self.wav_path, output_path, quality=quality))
+        with open(output_path, 'rb') as f:
+            return f.read()
+
+    def test_vbr_presets_are_not_capped_at_128k(self):
+        high = self.encode("320k")
+        low = self.encode("128k")
+
+        self.assertGreater(len(high), len(low) * 1.5)
+        self.assertGreater(max(read_frame_bitrates(high)), 128)
+
+    def test_vbr_output_varies_frame_bitrate(self):
+        bitrates = read_frame_bitrates(self.encode("192k"))
+
+        self.assertGreater(len(set(bitrates[1:])), 1)
+
+    def test_vbr_output_has_xing_header(self):
+        data = self.encode("192k")
+        frame_length = mp3_frame_length(data[:4])
+        frame_count, byte_count = struct.unpack(">II", data[44:52])
+
+        self.assertEqual(data[36:40], b"Xing")
+        self.assertEqual(frame_count, len(read_frame_bitrates(data)) - 1)
+        self.assertEqual(byte_count, len(data))
+        self.assertLess(frame_length, len(data))
+
+    def test_unmapped_bitrate_stays_cbr(self):
+        bitrates = read_frame_bitrates(self.encode("160k"))
+
+        self.assertEqual(set(bitrates), {160})
+
+
+class BuildAudioCommandTest(unittest.TestCase):
+
+    def test_mp3_to_file_is_vbr(self):
+        cmd = build_audio_command("pipe:0", "out.mp3", "mp3", quality="320k")
+
+        self.assertEqual(cmd[cmd.index("-q:a") + 1], MP3_VBR_QUALITY["320k"])
+        self.assertNotIn("-ab", cmd)
+
+    def test_mp3_to_pipe_is_cbr(self):
+        cmd = build_audio_command("pipe:0", "pipe:1", "mp3", quality="320k")
+
+        self.assertEqual(cmd[cmd.index("-ab") + 1], "320k")
+        self.assertNotIn("-q:a", cmd)
+
+
+if __name__ == "__main__":
+    unittest.main()
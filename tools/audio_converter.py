@@ -1,12 +1,54 @@
 import streamlit as st
 import os
 import tempfile
+import zipfile
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from typing import Dict, Any, Optional
 
-from utils.file_utils import sanitize_filename, get_file_info, check_file_format
-from utils.ffmped_utils import convert_audio
-from config import SUPPORTED_FORMATS, QUALITY_PRESETS, MIME_TYPES
+from utils.file_utils import sanitize_filename, get_file_info, check_file_format, save_upload_to_temp, temp_parent_dir
+from utils.ffmped_utils import (
+    convert_audio, convert_audio_to_bytes, encode_wav_to_mp3, set_ffmpeg_thread_limit,
+    PIPE_MUXERS, PIPE_DEMUXERS
+)
+from config import APP_CONFIG, SUPPORTED_FORMATS, QUALITY_PRESETS, MIME_TYPES
+
+def _convert_batch_file(
+    input_path: str,
+    output_path: str,
+    file_extension: str,
+    output_format: str,
+    quality: str,
+    sample_rate: int,
+    normalize: bool
+) -> Optional[str]:
+    """Convert one batch upload in a worker process, returning the output path on success"""
+    success = False
+    if file_extension == "wav" and output_format == "mp3" and not normalize:
+        # Plain WAV to MP3 is encoded in-process when possible
+        success = encode_wav_to_mp3(
+            input_path,
+            output_path,
+            quality=quality,
+            sample_rate=sample_rate,
+            channels=2
+        )
+    
+    if not success:
+        # Convert audio with DAT support
+        success = convert_audio(
+            input_path=input_path,
+            output_path=output_path,
+            output_format=output_format,
+            quality=quality,
+            sample_rate=sample_rate,
+            channels=2,
+            normalize=normalize,
+            input_format="dat" if file_extension == "dat" else None
+        )
+    
+    return output_path if success and os.path.exists(output_path) else None
 
 def render_page():
     """Render the audio converter page"""
@@ -60,7 +102,7 @@ def render_page():
                 "🎚️ Audio Quality",
                 list(QUALITY_PRESETS["audio"].keys()),
                 index=1,
-                help="Select audio quality preset (Low: 128k, Medium: 192k, High: 256k, Maximum: 320k)"
+                help="Select audio quality preset (Low: 128k, Medium: 192k, High: 256k, Maximum: 320k). MP3 is encoded as VBR averaging about these bitrates, so exact size varies with the material; small files converted in memory use the exact bitrate"
             )
         
         with col2:
@@ -146,17 +188,16 @@ def render_page():
         else:
             try:
                 with st.spinner("🔄 Converting audio..."):
-                    # Create temporary file with proper extension handling for DAT files
                     file_extension = uploaded_file.name.split('.')[-1].lower()
-                    if file_extension == 'dat':
-                        # For DAT files, we'll let FFmpeg handle the format detection
-                        temp_suffix = ".dat"
-                    else:
-                        temp_suffix = f".{file_extension}"
                     
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=temp_suffix) as tmp_file:
-                        tmp_file.write(uploaded_file.getvalue())
-                        input_path = tmp_file.name
+                    # Small conversions are read straight from FFmpeg's stdout instead of a file
+                    use_memory = (
+                        file_extension != "dat"
+                        and output_format in PIPE_MUXERS
+                        and uploaded_file.size <= APP_CONFIG["in_memory_max_size"]
+                    )
+                    # Streamable inputs are fed through stdin instead of a temp file
+                    pipe_input = file_extension in PIPE_DEMUXERS
                     
                     # Prepare output filename
                     base_name = os.path.splitext(uploaded_file.name)[0]
@@ -168,55 +209,78 @@ def render_page():
                     output_dir.mkdir(exist_ok=True)
                     output_path = output_dir / output_filename
                     
-                    # Convert audio with special handling for DAT files
-                    success = convert_audio(
-                        input_path=input_path,
-                        output_path=str(output_path),
-                        output_format=output_format,
-                        quality=QUALITY_PRESETS["audio"][quality],
-                        sample_rate=int(sample_rate),
-                        channels=1 if channels.startswith("1") else 2,
-                        start_time=float(start_time) if start_time else None,
-                        end_time=float(end_time) if end_time else None,
-                        normalize=normalize,
-                        fade_in=fade_in,
-                        fade_out=fade_out,
-                        input_format="dat" if file_extension == "dat" else None
-                    )
+                    # Inputs that are not piped are written to a temp directory removed after conversion
+                    if pipe_input:
+                        input_context = nullcontext("pipe:0")
+                    else:
+                        input_context = save_upload_to_temp(uploaded_file, APP_CONFIG["temp_dir_prefix"])
                     
-                    # Clean up input file
-                    try:
-                        os.unlink(input_path)
-                    except:
-                        pass
+                    with input_context as input_path:
+                        conversion_options = dict(
+                            input_path=input_path,
+                            output_format=output_format,
+                            quality=QUALITY_PRESETS["audio"][quality],
+                            sample_rate=int(sample_rate),
+                            channels=1 if channels.startswith("1") else 2,
+                            start_time=float(start_time) if start_time else None,
+                            end_time=float(end_time) if end_time else None,
+                            normalize=normalize,
+                            fade_in=fade_in,
+                            fade_out=fade_out,
+                            input_data=uploaded_file.getbuffer() if pipe_input else None
+                        )
+                    
+                        if use_memory:
+                            file_data = convert_audio_to_bytes(**conversion_options)
+                            success = file_data is not None
+                        else:
+                            # Convert audio with special handling for DAT files
+                            success = convert_audio(
+                                output_path=str(output_path),
+                                input_format="dat" if file_extension == "dat" else None,
+                                **conversion_options
+                            ) and output_path.exists()
                     
-                    if success and output_path.exists():
+                    if success:
                         st.success("✅ Audio conversion completed successfully!")
                         
-                        # Get file info
-                        file_info = get_file_info(str(output_path))
-                        if file_info:
-                            col1, col2, col3 = st.columns(3)
+                        if use_memory:
+                            col1, col2 = st.columns(2)
                             with col1:
-                                st.metric("File Size", f"{file_info['file_size_mb']:.1f} MB")
+                                st.metric("File Size", f"{len(file_data) / (1024*1024):.1f} MB")
                             with col2:
-                                st.metric("Duration", f"{file_info['duration_min']:.1f} min")
-                            with col3:
                                 st.metric("Format", output_format.upper())
+                        else:
+                            # Get file info
+                            file_info = get_file_info(str(output_path))
+                            if file_info:
+                                col1, col2, col3 = st.columns(3)
+                                with col1:
+                                    st.metric("File Size", f"{file_info['file_size_mb']:.1f} MB")
+                                with col2:
+                                    st.metric("Duration", f"{file_info['duration_min']:.1f} min")
+                                with col3:
+                                    st.metric("Format", output_format.upper())
                         
                         # Download button
-                        with open(output_path, 'rb') as f:
-                            file_data = f.read()
-                        
-                        st.download_button(
-                            label="📥 Download Converted Audio",
-                            data=file_data,
-                            file_name=output_filename
-                        )
+                        if use_memory:
+                            st.download_button(
+                                label="📥 Download Converted Audio",
+                                data=file_data,
+                                file_name=output_filename
+                            )
+                        else:
+                            # Hand Streamlit the file handle rather than a bytes copy of our own
+                            with open(output_path, 'rb') as f:
+                                st.download_button(
+                                    label="📥 Download Converted Audio",
+                                    data=f,
+                                    file_name=output_filename
+                                )
                         
                         # Preview section
                         st.subheader("🎧 Audio Preview")
-                        st.audio(file_data, format=f"audio/{output_format}")
+                        st.audio(file_data if use_memory else str(output_path), format=f"audio/{output_format}")
                         
                     else:
                         st.error("❌ Audio conversion failed. Please check the file and try again.")
@@ -285,86 +349,96 @@ def render_page():
             
             converted_files = []
             
-            for i, uploaded_file in enumerate(uploaded_files):
-                status_text.text(f"Converting {uploaded_file.name}...")
-                
-                try:
-                    # Handle file extension for DAT files
-                    file_extension = uploaded_file.name.split('.')[-1].lower()
-                    temp_suffix = f".{file_extension}"
-                    
-                    # Create temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=temp_suffix) as tmp_file:
-                        tmp_file.write(uploaded_file.getvalue())
-                        input_path = tmp_file.name
-                    
-                    # Prepare output filename
-                    base_name = os.path.splitext(uploaded_file.name)[0]
-                    output_filename = f"{base_name}_converted.{batch_output_format}"
-                    output_filename = sanitize_filename(output_filename)
-                    
-                    # Create output directory
-                    output_dir = Path("downloads")
-                    output_dir.mkdir(exist_ok=True)
-                    output_path = output_dir / output_filename
-                    
-                    # Convert audio with DAT support
-                    success = convert_audio(
-                        input_path=input_path,
-                        output_path=str(output_path),
-                        output_format=batch_output_format,
-                        quality=QUALITY_PRESETS["audio"][batch_quality],
-                        sample_rate=int(batch_sample_rate),
-                        channels=2,
-                        normalize=batch_normalize,
-                        input_format="dat" if file_extension == "dat" else None
-                    )
-                    
-                    # Clean up input file
-                    try:
-                        os.unlink(input_path)
-                    except:
-                        pass
-                    
-                    if success and output_path.exists():
-                        converted_files.append(str(output_path))
-                    
-                    # Update progress
-                    progress_bar.progress((i + 1) / len(uploaded_files))
-                    
-                except Exception as e:
-                    st.error(f"Error converting {uploaded_file.name}: {str(e)}")
+            # Create output directory
+            output_dir = Path("downloads")
+            output_dir.mkdir(exist_ok=True)
             
-            status_text.text("Batch conversion completed!")
+            status_text.text(f"Converting {len(uploaded_files)} files...")
             
-            if converted_files:
-                st.success(f"✅ Successfully converted {len(converted_files)} files!")
-                
-                # Create zip file for batch download
-                import zipfile
-                zip_path = output_dir / "converted_audio_files.zip"
-                
-                with zipfile.ZipFile(zip_path, 'w') as zipf:
-                    for file_path in converted_files:
-                        zipf.write(file_path, os.path.basename(file_path))
+            # One temporary directory for the whole batch, removed when it finishes
+            batch_size = sum(f.size for f in uploaded_files)
+            with tempfile.TemporaryDirectory(prefix=APP_CONFIG["temp_dir_prefix"], dir=temp_parent_dir(batch_size)) as temp_dir:
+                # LAME is single-threaded, so spread the files across processes
+                max_workers = min(os.cpu_count() or 1, len(uploaded_files))
+                # Each worker runs its own FFmpeg, so the workers share the cores between them
+                with ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=set_ffmpeg_thread_limit,
+                    initargs=(max(1, (os.cpu_count() or 1) // max_workers),)
+                ) as executor:
+                    futures = {}
+                    batch_output_names = set()
                 
-                # Download zip button
-                with open(zip_path, 'rb') as f:
-                    zip_data = f.read()
+                    for i, uploaded_file in enumerate(uploaded_files):
+                        try:
+                            # Handle file extension for DAT files
+                            file_extension = uploaded_file.name.split('.')[-1].lower()
+                            temp_suffix = f".{file_extension}"
+                        
+                            # Write the upload into the batch's temporary directory
+                            input_path = os.path.join(temp_dir, f"{i}{temp_suffix}")
+                            with open(input_path, 'wb') as tmp_file:
+                                tmp_file.write(uploaded_file.getbuffer())
+                        
+                            # Prepare output filename
+                            base_name = os.path.splitext(uploaded_file.name)[0]
+                            output_filename = f"{base_name}_converted.{batch_output_format}"
+                            output_filename = sanitize_filename(output_filename)
+                            # Uploads can share a name; the workers run concurrently, so
+                            # prefix the index rather than let two of them write one file
+                            while output_filename in batch_output_names:
+                                output_filename = sanitize_filename(f"{i}_{output_filename}")
+                            batch_output_names.add(output_filename)
+                            output_path = output_dir / output_filename
+                        
+                            future = executor.submit(
+                                _convert_batch_file,
+                                input_path,
+                                str(output_path),
+                                file_extension,
+                                batch_output_format,
+                                QUALITY_PRESETS["audio"][batch_quality],
+                                int(batch_sample_rate),
+                                batch_normalize
+                            )
+                            futures[future] = uploaded_file.name
+                        
+                        except Exception as e:
+                            st.error(f"Error converting {uploaded_file.name}: {str(e)}")
                 
-                st.download_button(
-                    label="📦 Download All Converted Files (ZIP)",
-                    data=zip_data,
-                    file_name="converted_audio_files.zip"
-                )
+                    for completed, future in enumerate(as_completed(futures), start=1):
+                        file_name = futures[future]
+                        try:
+                            output_path = future.result()
+                            if output_path:
+                                converted_files.append(output_path)
+                        except Exception as e:
+                            st.error(f"Error converting {file_name}: {str(e)}")
+                    
+                        # Update progress
+                        status_text.text(f"Converted {file_name}")
+                        progress_bar.progress(completed / len(futures))
+
+                status_text.text("Batch conversion completed!")
+            
+                if converted_files:
+                    st.success(f"✅ Successfully converted {len(converted_files)} files!")
                 
-                # Clean up zip file
-                try:
-                    os.unlink(zip_path)
-                except:
-                    pass
-            else:
-                st.error("❌ No files were successfully converted")
+                    # Build the zip in the batch's temporary directory; Streamlit reads
+                    # it from the handle before the directory is removed
+                    zip_path = os.path.join(temp_dir, "converted_audio_files.zip")
+                    with zipfile.ZipFile(zip_path, 'w') as zipf:
+                        for file_path in converted_files:
+                            zipf.write(file_path, os.path.basename(file_path))
+                    
+                    with open(zip_path, 'rb') as zip_file:
+                        st.download_button(
+                            label="📦 Download All Converted Files (ZIP)",
+                            data=zip_file,
+                            file_name="converted_audio_files.zip"
+                        )
+                else:
+                    st.error("❌ No files were successfully converted")
                 
         except Exception as e:
             st.error(f"❌ Error during batch conversion: {str(e)}")
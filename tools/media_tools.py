@@ -1,13 +1,47 @@
 import streamlit as st
 import os
-import tempfile
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Dict, Any, Optional
 import json
 
-from utils.file_utils import sanitize_filename, get_file_info, check_file_format
-from utils.ffmped_utils import extract_audio_from_video, compress_video, analyze_media
-from config import SUPPORTED_FORMATS, QUALITY_PRESETS, MIME_TYPES
+from utils.file_utils import sanitize_filename, get_file_info, check_file_format, save_upload_to_temp
+from utils.ffmped_utils import extract_audio_from_video, convert_audio_to_bytes, compress_video, analyze_media, PIPE_MUXERS, VIDEO_PIPE_DEMUXERS
+from config import APP_CONFIG, SUPPORTED_FORMATS, QUALITY_PRESETS, MIME_TYPES
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def analyze_upload(file_id: str, analysis_type: str, _uploaded_file) -> Optional[Dict[str, Any]]:
+    """
+    Analyze an uploaded media file, cached per upload
+    
+    Keyed on the upload's file_id, so re-running an analysis on the same
+    upload skips writing it to disk and re-running ffprobe.
+    
+    Args:
+        file_id: Streamlit file_id of the upload
+        analysis_type: Type of analysis passed to analyze_media
+        _uploaded_file: Streamlit uploaded file (not hashed)
+    
+    Returns:
+        Analysis results or None if error
+    """
+    with save_upload_to_temp(_uploaded_file, APP_CONFIG["temp_dir_prefix"]) as input_path:
+        return analyze_media(input_path, analysis_type)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_upload_info(file_id: str, _uploaded_file) -> Optional[Dict[str, Any]]:
+    """
+    Get file information for an uploaded file, cached per upload
+    
+    Args:
+        file_id: Streamlit file_id of the upload
+        _uploaded_file: Streamlit uploaded file (not hashed)
+    
+    Returns:
+        Dictionary containing file information or None if error
+    """
+    with save_upload_to_temp(_uploaded_file, APP_CONFIG["temp_dir_prefix"]) as input_path:
+        return get_file_info(input_path)
 
 def render_page():
     """Render the media tools page"""
@@ -83,10 +117,11 @@ def render_audio_extraction():
     if submitted and uploaded_file is not None:
         try:
             with st.spinner("🎵 Extracting audio..."):
-                # Create temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    input_path = tmp_file.name
+                # Audio from small videos is read straight from FFmpeg's stdout instead of a file
+                use_memory = (
+                    audio_format in PIPE_MUXERS
+                    and uploaded_file.size <= APP_CONFIG["in_memory_max_size"]
+                )
                 
                 # Prepare output filename
                 base_name = os.path.splitext(uploaded_file.name)[0]
@@ -99,46 +134,56 @@ def render_audio_extraction():
                 output_path = output_dir / output_filename
                 
                 # Extract audio
-                success = extract_audio_from_video(
-                    input_path=input_path,
-                    output_path=str(output_path),
-                    audio_format=audio_format,
-                    quality=QUALITY_PRESETS["audio"][quality],
-                    sample_rate=int(sample_rate),
-                    channels=1 if channels.startswith("1") else 2
-                )
-                
-                # Clean up input file
-                try:
-                    os.unlink(input_path)
-                except:
-                    pass
+                with save_upload_to_temp(uploaded_file, APP_CONFIG["temp_dir_prefix"]) as input_path:
+                    extraction_options = dict(
+                        input_path=input_path,
+                        quality=QUALITY_PRESETS["audio"][quality],
+                        sample_rate=int(sample_rate),
+                        channels=1 if channels.startswith("1") else 2
+                    )
+                    
+                    if use_memory:
+                        file_data = convert_audio_to_bytes(output_format=audio_format, **extraction_options)
+                        success = file_data is not None
+                    else:
+                        success = extract_audio_from_video(
+                            output_path=str(output_path),
+                            audio_format=audio_format,
+                            **extraction_options
+                        ) and output_path.exists()
                 
-                if success and output_path.exists():
+                if success:
                     st.success("✅ Audio extraction completed successfully!")
                     
-                    # Get file info
-                    file_info = get_file_info(str(output_path))
-                    if file_info:
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.metric("File Size", f"{file_info['file_size_mb']:.1f} MB")
-                        with col2:
-                            st.metric("Duration", f"{file_info['duration_min']:.1f} min")
-                    
-                    # Download button
-                    with open(output_path, 'rb') as f:
-                        file_data = f.read()
-                    
-                    st.download_button(
-                        label="📥 Download Extracted Audio",
-                        data=file_data,
-                        file_name=output_filename
-                    )
+                    if use_memory:
+                        st.metric("File Size", f"{len(file_data) / (1024*1024):.1f} MB")
+                        
+                        st.download_button(
+                            label="📥 Download Extracted Audio",
+                            data=file_data,
+                            file_name=output_filename
+                        )
+                    else:
+                        # Get file info
+                        file_info = get_file_info(str(output_path))
+                        if file_info:
+                            col1, col2 = st.columns(2)
+                            with col1:
+                                st.metric("File Size", f"{file_info['file_size_mb']:.1f} MB")
+                            with col2:
+                                st.metric("Duration", f"{file_info['duration_min']:.1f} min")
+                        
+                        # Hand Streamlit the file handle rather than a bytes copy of our own
+                        with open(output_path, 'rb') as f:
+                            st.download_button(
+                                label="📥 Download Extracted Audio",
+                                data=f,
+                                file_name=output_filename
+                            )
                     
                     # Audio preview
                     st.subheader("🎧 Audio Preview")
-                    st.audio(file_data, format=f"audio/{audio_format}")
+                    st.audio(file_data if use_memory else str(output_path), format=f"audio/{audio_format}")
                     
                 else:
                     st.error("❌ Audio extraction failed. Please check the file and try again.")
@@ -197,6 +242,12 @@ def render_video_compression():
                     value=False,
                     help="Prioritize quality over file size"
                 )
+                
+                use_gpu = st.checkbox(
+                    "🚀 Use GPU if available",
+                    value=False,
+                    help="Encode with NVENC, Quick Sync, VideoToolbox or VAAPI when the hardware is present"
+                )
             
             submitted = st.form_submit_button("📹 Compress Video")
     
@@ -204,11 +255,6 @@ def render_video_compression():
     if submitted and uploaded_file is not None:
         try:
             with st.spinner("📹 Compressing video..."):
-                # Create temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    input_path = tmp_file.name
-                
                 # Prepare output filename
                 base_name = os.path.splitext(uploaded_file.name)[0]
                 output_filename = f"{base_name}_compressed.{output_format}"
@@ -222,22 +268,26 @@ def render_video_compression():
                 # Get compression settings
                 compression_settings = QUALITY_PRESETS["compression"][compression_level]
                 
-                # Compress video
-                success = compress_video(
-                    input_path=input_path,
-                    output_path=str(output_path),
-                    output_format=output_format,
-                    crf=compression_settings["crf"],
-                    preset=compression_settings["preset"],
-                    target_size_mb=target_size,
-                    maintain_quality=maintain_quality
-                )
+                # Streamable containers are fed through stdin instead of a temp file
+                pipe_input = os.path.splitext(uploaded_file.name)[1][1:].lower() in VIDEO_PIPE_DEMUXERS
+                if pipe_input:
+                    input_context = nullcontext("pipe:0")
+                else:
+                    input_context = save_upload_to_temp(uploaded_file, APP_CONFIG["temp_dir_prefix"])
                 
-                # Clean up input file
-                try:
-                    os.unlink(input_path)
-                except:
-                    pass
+                # Compress video
+                with input_context as input_path:
+                    success = compress_video(
+                        input_path=input_path,
+                        output_path=str(output_path),
+                        output_format=output_format,
+                        crf=compression_settings["crf"],
+                        preset=compression_settings["preset"],
+                        target_size_mb=target_size,
+                        maintain_quality=maintain_quality,
+                        use_gpu=use_gpu,
+                        input_data=uploaded_file.getbuffer() if pipe_input else None
+                    )
                 
                 if success and output_path.exists():
                     st.success("✅ Video compression completed successfully!")
@@ -256,19 +306,17 @@ def render_video_compression():
                             compression_ratio = ((original_size - compressed_info['file_size_mb']) / original_size) * 100
                             st.metric("Size Reduction", f"{compression_ratio:.1f}%")
                     
-                    # Download button
+                    # Hand Streamlit the file handle rather than a bytes copy of our own
                     with open(output_path, 'rb') as f:
-                        file_data = f.read()
-                    
-                    st.download_button(
-                        label="📥 Download Compressed Video",
-                        data=file_data,
-                        file_name=output_filename
-                    )
+                        st.download_button(
+                            label="📥 Download Compressed Video",
+                            data=f,
+                            file_name=output_filename
+                        )
                     
                     # Video preview
                     st.subheader("🎬 Compressed Video Preview")
-                    st.video(file_data)
+                    st.video(str(output_path))
                     
                 else:
                     st.error("❌ Video compression failed. Please check the file and try again.")
@@ -304,19 +352,8 @@ def render_media_analysis():
     if submitted and uploaded_file is not None:
         try:
             with st.spinner("📊 Analyzing media file..."):
-                # Create temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    input_path = tmp_file.name
-                
                 # Analyze media
-                analysis_result = analyze_media(input_path, analysis_type)
-                
-                # Clean up input file
-                try:
-                    os.unlink(input_path)
-                except:
-                    pass
+                analysis_result = analyze_upload(uploaded_file.file_id, analysis_type, uploaded_file)
                 
                 if analysis_result:
                     st.success("✅ Media analysis completed!")
@@ -426,19 +463,8 @@ def render_format_detection():
     if submitted and uploaded_file is not None:
         try:
             with st.spinner("🔄 Detecting file format..."):
-                # Create temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    input_path = tmp_file.name
-                
                 # Detect format
-                file_info = get_file_info(input_path)
-                
-                # Clean up input file
-                try:
-                    os.unlink(input_path)
-                except:
-                    pass
+                file_info = get_upload_info(uploaded_file.file_id, uploaded_file)
                 
                 if file_info:
                     st.success("✅ Format detection completed!")
@@ -1,12 +1,14 @@
 import streamlit as st
 import os
 import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from typing import Dict, Any, Optional
 
-from utils.file_utils import sanitize_filename, get_file_info, check_file_format
-from utils.ffmped_utils import convert_video
-from config import SUPPORTED_FORMATS, QUALITY_PRESETS, MIME_TYPES
+from utils.file_utils import sanitize_filename, get_file_info, check_file_format, save_upload_to_temp, temp_parent_dir
+from utils.ffmped_utils import convert_video, set_ffmpeg_thread_limit
+from config import APP_CONFIG, SUPPORTED_FORMATS, QUALITY_PRESETS, MIME_TYPES
 
 def render_page():
     """Render the video converter page"""
@@ -132,6 +134,12 @@ def render_page():
                     value=False,
                     help="Remove interlacing artifacts from interlaced video"
                 )
+                
+                use_gpu = st.checkbox(
+                    "🚀 Use GPU if available",
+                    value=False,
+                    help="Encode H.264/H.265 with NVENC, Quick Sync, VideoToolbox or VAAPI when the hardware is present"
+                )
         
         # Show file info if uploaded
         if uploaded_file is not None:
@@ -153,11 +161,6 @@ def render_page():
         else:
             try:
                 with st.spinner("🔄 Converting video..."):
-                    # Create temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                        tmp_file.write(uploaded_file.getvalue())
-                        input_path = tmp_file.name
-                    
                     # Prepare output filename
                     base_name = os.path.splitext(uploaded_file.name)[0]
                     output_filename = f"{base_name}_converted.{output_format}"
@@ -205,28 +208,24 @@ def render_page():
                             st.warning("Invalid end time format, using full duration")
                     
                     # Convert video
-                    success = convert_video(
-                        input_path=input_path,
-                        output_path=str(output_path),
-                        output_format=output_format,
-                        quality_preset=quality,
-                        resolution=target_resolution,
-                        fps=target_fps,
-                        start_time=start_seconds,
-                        end_time=end_seconds,
-                        crop_width=crop_width if crop_width > 0 else None,
-                        crop_height=crop_height if crop_height > 0 else None,
-                        audio_codec=audio_codec,
-                        video_codec=video_codec,
-                        two_pass=two_pass,
-                        deinterlace=deinterlace
-                    )
-                    
-                    # Clean up input file
-                    try:
-                        os.unlink(input_path)
-                    except:
-                        pass
+                    with save_upload_to_temp(uploaded_file, APP_CONFIG["temp_dir_prefix"]) as input_path:
+                        success = convert_video(
+                            input_path=input_path,
+                            output_path=str(output_path),
+                            output_format=output_format,
+                            quality_preset=quality,
+                            resolution=target_resolution,
+                            fps=target_fps,
+                            start_time=start_seconds,
+                            end_time=end_seconds,
+                            crop_width=crop_width if crop_width > 0 else None,
+                            crop_height=crop_height if crop_height > 0 else None,
+                            audio_codec=audio_codec,
+                            video_codec=video_codec,
+                            two_pass=two_pass,
+                            deinterlace=deinterlace,
+                            use_gpu=use_gpu
+                        )
                     
                     if success and output_path.exists():
                         st.success("✅ Video conversion completed successfully!")
@@ -242,19 +241,17 @@ def render_page():
                             with col3:
                                 st.metric("Format", output_format.upper())
                         
-                        # Download button
+                        # Hand Streamlit the file handle rather than a bytes copy of our own
                         with open(output_path, 'rb') as f:
-                            file_data = f.read()
-                        
-                        st.download_button(
-                            label="📥 Download Converted Video",
-                            data=file_data,
-                            file_name=output_filename
-                        )
+                            st.download_button(
+                                label="📥 Download Converted Video",
+                                data=f,
+                                file_name=output_filename
+                            )
                         
                         # Video preview
                         st.subheader("🎬 Video Preview")
-                        st.video(file_data)
+                        st.video(str(output_path))
                         
                     else:
                         st.error("❌ Video conversion failed. Please check the file and try again.")
@@ -309,6 +306,12 @@ def render_page():
                     index=0,
                     key="batch_audio_codec"
                 )
+                
+                batch_use_gpu = st.checkbox(
+                    "Use GPU if available",
+                    value=False,
+                    key="batch_use_gpu"
+                )
             
             batch_submitted = st.form_submit_button("🔄 Convert All Videos")
     
@@ -320,90 +323,100 @@ def render_page():
             
             converted_files = []
             
-            for i, uploaded_file in enumerate(uploaded_files):
-                status_text.text(f"Converting {uploaded_file.name}...")
-                
-                try:
-                    # Create temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                        tmp_file.write(uploaded_file.getvalue())
-                        input_path = tmp_file.name
-                    
-                    # Prepare output filename
-                    base_name = os.path.splitext(uploaded_file.name)[0]
-                    output_filename = f"{base_name}_converted.{batch_output_format}"
-                    output_filename = sanitize_filename(output_filename)
-                    
-                    # Create output directory
-                    output_dir = Path("downloads")
-                    output_dir.mkdir(exist_ok=True)
-                    output_path = output_dir / output_filename
-                    
-                    # Parse resolution
-                    target_resolution = None
-                    if batch_resolution != "Original":
-                        if "1080p" in batch_resolution:
-                            target_resolution = (1920, 1080)
-                        elif "720p" in batch_resolution:
-                            target_resolution = (1280, 720)
-                        elif "480p" in batch_resolution:
-                            target_resolution = (854, 480)
-                    
-                    # Convert video
-                    success = convert_video(
-                        input_path=input_path,
-                        output_path=str(output_path),
-                        output_format=batch_output_format,
-                        quality_preset=batch_quality,
-                        resolution=target_resolution,
-                        audio_codec=batch_audio_codec
-                    )
-                    
-                    # Clean up input file
-                    try:
-                        os.unlink(input_path)
-                    except:
-                        pass
-                    
-                    if success and output_path.exists():
-                        converted_files.append(str(output_path))
+            # Parse resolution
+            target_resolution = None
+            if batch_resolution != "Original":
+                if "1080p" in batch_resolution:
+                    target_resolution = (1920, 1080)
+                elif "720p" in batch_resolution:
+                    target_resolution = (1280, 720)
+                elif "480p" in batch_resolution:
+                    target_resolution = (854, 480)
+            
+            # Create output directory
+            output_dir = Path("downloads")
+            output_dir.mkdir(exist_ok=True)
+            
+            status_text.text(f"Converting {len(uploaded_files)} videos...")
+            
+            # One temporary directory for the whole batch, removed when it finishes
+            batch_size = sum(f.size for f in uploaded_files)
+            with tempfile.TemporaryDirectory(prefix=APP_CONFIG["temp_dir_prefix"], dir=temp_parent_dir(batch_size)) as temp_dir:
+                # Convert the videos side by side, splitting the cores between the workers
+                max_workers = min(os.cpu_count() or 1, len(uploaded_files))
+                with ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=set_ffmpeg_thread_limit,
+                    initargs=(max(1, (os.cpu_count() or 1) // max_workers),)
+                ) as executor:
+                    futures = {}
+                    batch_output_names = set()
                     
-                    # Update progress
-                    progress_bar.progress((i + 1) / len(uploaded_files))
+                    for i, uploaded_file in enumerate(uploaded_files):
+                        try:
+                            # Write the upload into the batch's temporary directory
+                            input_path = os.path.join(temp_dir, f"{i}.{uploaded_file.name.split('.')[-1]}")
+                            with open(input_path, 'wb') as tmp_file:
+                                tmp_file.write(uploaded_file.getbuffer())
+                            
+                            # Prepare output filename
+                            base_name = os.path.splitext(uploaded_file.name)[0]
+                            output_filename = f"{base_name}_converted.{batch_output_format}"
+                            output_filename = sanitize_filename(output_filename)
+                            # Uploads can share a name; the workers run concurrently, so
+                            # prefix the index rather than let two of them write one file
+                            while output_filename in batch_output_names:
+                                output_filename = sanitize_filename(f"{i}_{output_filename}")
+                            batch_output_names.add(output_filename)
+                            output_path = output_dir / output_filename
+                            
+                            future = executor.submit(
+                                convert_video,
+                                input_path=input_path,
+                                output_path=str(output_path),
+                                output_format=batch_output_format,
+                                quality_preset=batch_quality,
+                                resolution=target_resolution,
+                                audio_codec=batch_audio_codec,
+                                use_gpu=batch_use_gpu
+                            )
+                            futures[future] = (uploaded_file.name, output_path)
+                            
+                        except Exception as e:
+                            st.error(f"Error converting {uploaded_file.name}: {str(e)}")
                     
-                except Exception as e:
-                    st.error(f"Error converting {uploaded_file.name}: {str(e)}")
+                    for completed, future in enumerate(as_completed(futures), start=1):
+                        file_name, output_path = futures[future]
+                        try:
+                            if future.result() and output_path.exists():
+                                converted_files.append(str(output_path))
+                        except Exception as e:
+                            st.error(f"Error converting {file_name}: {str(e)}")
+                        
+                        # Update progress
+                        status_text.text(f"Converted {file_name}")
+                        progress_bar.progress(completed / len(futures))
             
-            status_text.text("Batch conversion completed!")
+                status_text.text("Batch conversion completed!")
             
-            if converted_files:
-                st.success(f"✅ Successfully converted {len(converted_files)} videos!")
-                
-                # Create zip file for batch download
-                import zipfile
-                zip_path = output_dir / "converted_video_files.zip"
-                
-                with zipfile.ZipFile(zip_path, 'w') as zipf:
-                    for file_path in converted_files:
-                        zipf.write(file_path, os.path.basename(file_path))
-                
-                # Download zip button
-                with open(zip_path, 'rb') as f:
-                    zip_data = f.read()
+                if converted_files:
+                    st.success(f"✅ Successfully converted {len(converted_files)} videos!")
                 
-                st.download_button(
-                    label="📦 Download All Converted Videos (ZIP)",
-                    data=zip_data,
-                    file_name="converted_video_files.zip"
-                )
-                
-                # Clean up zip file
-                try:
-                    os.unlink(zip_path)
-                except:
-                    pass
-            else:
-                st.error("❌ No videos were successfully converted")
+                    # Build the zip in the batch's temporary directory; Streamlit reads
+                    # it from the handle before the directory is removed
+                    zip_path = os.path.join(temp_dir, "converted_video_files.zip")
+                    with zipfile.ZipFile(zip_path, 'w') as zipf:
+                        for file_path in converted_files:
+                            zipf.write(file_path, os.path.basename(file_path))
+                    
+                    with open(zip_path, 'rb') as zip_file:
+                        st.download_button(
+                            label="📦 Download All Converted Videos (ZIP)",
+                            data=zip_file,
+                            file_name="converted_video_files.zip"
+                        )
+                else:
+                    st.error("❌ No videos were successfully converted")
                 
         except Exception as e:
             st.error(f"❌ Error during batch conversion: {str(e)}")
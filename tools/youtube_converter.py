@@ -1,14 +1,66 @@
 import streamlit as st
 import os
 import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.managers import SyncManager
 from pathlib import Path
 import yt_dlp
 from typing import Dict, Any, Optional
 
-from utils.youtube_utils import download_youtube_audio, download_youtube_video
+from utils.youtube_utils import download_youtube_audio, download_youtube_video, is_youtube_url
 from utils.file_utils import sanitize_filename, get_file_info
 from config import SUPPORTED_FORMATS, YT_DLP_OPTIONS, QUALITY_PRESETS
 
+# Seconds between progress bar updates while downloads run
+PROGRESS_POLL_INTERVAL = 0.2
+
+@st.cache_resource
+def get_download_executor() -> ProcessPoolExecutor:
+    """
+    Get the process pool shared by all sessions for YouTube downloads
+    
+    Returns:
+        ProcessPoolExecutor sized to the CPU count
+    """
+    return ProcessPoolExecutor(max_workers=os.cpu_count())
+
+@st.cache_resource
+def get_progress_manager() -> SyncManager:
+    """
+    Get the manager that shares download progress with worker processes
+    
+    Returns:
+        Started multiprocessing SyncManager
+    """
+    return multiprocessing.Manager()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def probe_video_info(url: str) -> Dict[str, Any]:
+    """
+    Fetch a YouTube video's metadata without downloading it
+    
+    Cached for 10 minutes so resubmitting the same URL skips the page fetch
+    and player extraction; stream URLs stay valid well beyond that. The info
+    is left unprocessed (no format selection), so each download picks its
+    own formats from it.
+    
+    Args:
+        url: YouTube video URL
+    
+    Returns:
+        Unprocessed yt-dlp info dict
+    """
+    ydl_opts = YT_DLP_OPTIONS["base"].copy()
+    ydl_opts.update({
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True
+    })
+    
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False, process=False)
+
 def render_page():
     """Render the YouTube converter page"""
     
@@ -60,7 +112,7 @@ def render_page():
                 "Audio Quality",
                 list(QUALITY_PRESETS["audio"].keys()),
                 index=1,
-                help="Select audio quality preset"
+                help="Select audio quality preset (Low: 128k, Medium: 192k, High: 256k, Maximum: 320k). MP3 is encoded as VBR averaging about these bitrates"
             )
         elif conversion_type == "Video Only":
             quality = st.selectbox(
@@ -105,100 +157,134 @@ def render_page():
         submitted = st.form_submit_button("🚀 Download & Convert")
     
     if submitted and url:
-        if not url.strip():
+        url = url.strip()
+        if not is_youtube_url(url):
             st.error("Please enter a valid YouTube URL")
             return
         
         try:
             with st.spinner("🔍 Analyzing video..."):
                 # Get video info first
-                ydl_opts = YT_DLP_OPTIONS["base"].copy()
-                ydl_opts.update({
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extract_flat': True
-                })
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    try:
-                        info = ydl.extract_info(url, download=False)
-                        video_title = info.get('title', 'Unknown Title')
-                        duration = info.get('duration', 0)
-                        uploader = info.get('uploader', 'Unknown')
-                        
-                        st.success(f"✅ Video found: {video_title}")
-                        
-                        # Display video info
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.metric("Title", video_title[:30] + "..." if len(video_title) > 30 else video_title)
-                        with col2:
-                            st.metric("Duration", f"{duration//60}:{duration%60:02d}" if duration else "Unknown")
-                        with col3:
-                            st.metric("Uploader", uploader[:20] + "..." if len(uploader) > 20 else uploader)
-                        
-                    except Exception as e:
-                        st.error(f"❌ Error extracting video info: {str(e)}")
-                        return
-            
+                try:
+                    info = probe_video_info(url)
+                    video_title = info.get('title', 'Unknown Title')
+                    duration = info.get('duration', 0)
+                    uploader = info.get('uploader', 'Unknown')
+                    
+                    st.success(f"✅ Video found: {video_title}")
+                    
+                    # Display video info
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Title", video_title[:30] + "..." if len(video_title) > 30 else video_title)
+                    with col2:
+                        st.metric("Duration", f"{duration//60}:{duration%60:02d}" if duration else "Unknown")
+                    with col3:
+                        st.metric("Uploader", uploader[:20] + "..." if len(uploader) > 20 else uploader)
+                    
+                except Exception as e:
+                    st.error(f"❌ Error extracting video info: {str(e)}")
+                    return
+        
             # Download and convert
             with st.spinner("📥 Downloading and converting..."):
                 try:
+                    # Downloads run in worker processes, off this session's script thread
+                    executor = get_download_executor()
+                    
+                    # One shared dict per download for the workers' progress hooks
+                    download_count = 1 if conversion_type in ("Audio Only", "Video Only") else 2
+                    progress = [get_progress_manager().dict() for _ in range(download_count)]
+                    pending = []
+                    
                     if conversion_type == "Audio Only":
-                        output_file = download_youtube_audio(
+                        output_future = executor.submit(
+                            download_youtube_audio,
                             url, 
                             output_format, 
                             QUALITY_PRESETS["audio"][quality],
                             start_time=start_time if start_time else None,
-                            end_time=end_time if end_time else None
+                            end_time=end_time if end_time else None,
+                            info=info,
+                            progress=progress[0]
                         )
                     elif conversion_type == "Video Only":
-                        output_file = download_youtube_video(
+                        output_future = executor.submit(
+                            download_youtube_video,
                             url,
                             output_format,
                             QUALITY_PRESETS["video"][quality],
                             start_time=start_time if start_time else None,
-                            end_time=end_time if end_time else None
+                            end_time=end_time if end_time else None,
+                            info=info,
+                            progress=progress[0]
                         )
                     else:  # Both
-                        audio_file = download_youtube_audio(
+                        # Audio and video are fetched concurrently
+                        audio_future = executor.submit(
+                            download_youtube_audio,
                             url,
                             "mp3",
                             QUALITY_PRESETS["audio"]["medium"],
                             start_time=start_time if start_time else None,
-                            end_time=end_time if end_time else None
+                            end_time=end_time if end_time else None,
+                            info=info,
+                            progress=progress[1]
                         )
-                        video_file = download_youtube_video(
+                        output_future = executor.submit(
+                            download_youtube_video,
                             url,
                             "mp4",
                             QUALITY_PRESETS["video"]["medium"],
                             start_time=start_time if start_time else None,
-                            end_time=end_time if end_time else None
+                            end_time=end_time if end_time else None,
+                            info=info,
+                            progress=progress[0]
                         )
-                        output_file = video_file
+                        pending.append(audio_future)
+                    
+                    pending.append(output_future)
+                    
+                    # Drive the progress bar from the bytes the workers report,
+                    # sending an update only when the value actually moved
+                    progress_bar = st.progress(0.0)
+                    shown_fraction = 0.0
+                    while pending:
+                        _, pending = wait(pending, timeout=PROGRESS_POLL_INTERVAL)
+                        pending = list(pending)
+                        fractions = [p.get('fraction', 0.0) for p in progress]
+                        fraction = round(sum(fractions) / len(fractions), 2)
+                        if fraction != shown_fraction:
+                            progress_bar.progress(fraction)
+                            shown_fraction = fraction
+                    
+                    output_file = output_future.result()
                     
                     if output_file and os.path.exists(output_file):
                         st.success("✅ Conversion completed successfully!")
                         
-                        # Get file info
-                        file_info = get_file_info(output_file)
-                        if file_info:
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                st.metric("File Size", f"{file_info['file_size_mb']:.1f} MB")
-                            with col2:
-                                st.metric("Duration", f"{file_info['duration_min']:.1f} min")
+                        # The probe already has the duration of an untrimmed download,
+                        # so only trimmed output needs an ffprobe run
+                        if start_time or end_time:
+                            file_info = get_file_info(output_file)
+                            duration_min = file_info['duration_min'] if file_info else 0
+                        else:
+                            duration_min = (info.get('duration') or 0) / 60
                         
-                        # Download button
-                        with open(output_file, 'rb') as f:
-                            file_data = f.read()
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            st.metric("File Size", f"{os.path.getsize(output_file) / (1024 * 1024):.1f} MB")
+                        with col2:
+                            st.metric("Duration", f"{duration_min:.1f} min")
                         
+                        # Download button; Streamlit reads the handle itself, no extra bytes copy here
                         filename = os.path.basename(output_file)
-                        st.download_button(
-                            label="📥 Download File",
-                            data=file_data,
-                            file_name=filename
-                        )
+                        with open(output_file, 'rb') as f:
+                            st.download_button(
+                                label="📥 Download File",
+                                data=f,
+                                file_name=filename
+                            )
                         
                         # Clean up if not keeping original
                         if not keep_original:
@@ -1,34 +1,224 @@
 import os
+import struct
 import subprocess
 import tempfile
+import threading
+import wave
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, Any, Tuple
 import json
 
-def run_ffmpeg_command(cmd: list, timeout: int = 300) -> Tuple[bool, str, str]:
+try:
+    import lameenc
+except ImportError:
+    # Optional: without it every MP3 encode goes through FFmpeg
+    lameenc = None
+
+# Keep ffmpeg's stderr down to actual errors; progress and banner output is never shown
+FFMPEG_QUIET_ARGS = ["-hide_banner", "-loglevel", "error", "-nostats"]
+
+# Only the tail of stderr is surfaced on failure
+STDERR_TAIL_BYTES = 4096
+
+# Containers whose index (moov atom) is moved to the front for progressive playback
+FASTSTART_FORMATS = {"mp4", "mov"}
+
+# Input formats FFmpeg can demux from a non-seekable pipe
+PIPE_DEMUXERS = {"wav", "mp3", "flac", "ogg", "aac"}
+
+# Video containers that can be demuxed from a pipe; MP4/MOV usually keep
+# their index at the end and need a seekable file
+VIDEO_PIPE_DEMUXERS = {"mkv", "webm", "flv"}
+
+# LAME VBR quality (-q:a) standing in for each CBR bitrate preset
+MP3_VBR_QUALITY = {
+    "320k": "0",
+    "256k": "2",
+    "192k": "4",
+    "128k": "6"
+}
+
+# LAME algorithm quality (0 = slowest/best, 9 = fastest). q4 skips the slow
+# noise-shaping search for CBR; VBR keeps the full search.
+MP3_CBR_ALGORITHM_QUALITY = "4"
+MP3_VBR_ALGORITHM_QUALITY = "0"
+
+# Layer III bitrates (kbps) by header bitrate index, for MPEG-1 and MPEG-2/2.5
+MP3_FRAME_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+}
+
+# Sample rates by header version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5)
+MP3_FRAME_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000]
+}
+
+# Source codec that can be copied as-is into each output format
+STREAM_COPY_CODECS = {
+    "mp3": "mp3",
+    "aac": "aac",
+    "ogg": "vorbis",
+    "flac": "flac",
+    "wav": "pcm_s16le"
+}
+
+# Source codec each video encoder produces, so matching streams can be remuxed
+VIDEO_COPY_CODECS = {
+    "libx264": "h264",
+    "libx265": "hevc",
+    "libvpx-vp9": "vp9"
+}
+
+# Source codec each audio encoder produces, for remuxing alongside video
+AUDIO_COPY_CODECS = {
+    "aac": "aac",
+    "mp3": "mp3",
+    "libmp3lame": "mp3",
+    "libopus": "opus"
+}
+
+# Hardware encoders to try, in order, in place of each software encoder
+HW_ENCODERS = {
+    "libx264": ["h264_nvenc", "h264_qsv", "h264_videotoolbox", "h264_vaapi"],
+    "libx265": ["hevc_nvenc", "hevc_qsv", "hevc_videotoolbox", "hevc_vaapi"]
+}
+
+# DRM render node used by VAAPI encoders
+VAAPI_DEVICE = "/dev/dri/renderD128"
+
+# Output formats encoded to a requested bitrate
+BITRATE_FORMATS = {"mp3", "aac"}
+
+# PCM frames handed to LAME per encode call
+WAV_CHUNK_FRAMES = 1 << 16
+
+# Muxers that can be written to a non-seekable pipe, by output format
+PIPE_MUXERS = {
+    "mp3": "mp3",
+    "aac": "adts",
+    "ogg": "ogg"
+}
+
+# FFmpeg runs in flight in this process; the CPU is split between them
+_active_ffmpeg_runs = 0
+_active_ffmpeg_lock = threading.Lock()
+
+def ffmpeg_thread_count(active_runs: int) -> int:
     """
-    Run FFmpeg command and return success status and output
+    Get the thread count for one FFmpeg run
+    
+    FFmpeg otherwise starts up to one thread per core for every run, so
+    concurrent conversions oversubscribe the CPU. A positive integer in the
+    APP_FFMPEG_THREADS environment variable overrides the computed value;
+    anything else is ignored.
+    
+    Args:
+        active_runs: Number of FFmpeg runs in flight, including this one
+    
+    Returns:
+        Number of threads to pass to -threads
+    """
+    override = os.environ.get("APP_FFMPEG_THREADS", "").strip()
+    if override.isdigit() and int(override) > 0:
+        return int(override)
+    
+    return max(1, (os.cpu_count() or 2) // max(1, active_runs))
+
+def set_ffmpeg_thread_limit(threads: int) -> None:
+    """
+    Pin the FFmpeg thread count for this process (e.g. in pool workers)
+    
+    Args:
+        threads: Threads per FFmpeg run
+    """
+    os.environ["APP_FFMPEG_THREADS"] = str(threads)
+
+def run_ffmpeg_pipe(cmd: list, timeout: int = 300, input_data: Optional[bytes] = None) -> Tuple[bool, bytes, str]:
+    """
+    Run FFmpeg command and return its raw stdout
+    
+    stderr is spooled to a temporary file rather than a pipe and only the
+    tail is decoded, and only when the command fails.
     
     Args:
         cmd: FFmpeg command as list
         timeout: Command timeout in seconds
+        input_data: Bytes fed to the command's stdin (for 'pipe:0' inputs)
     
     Returns:
-        Tuple of (success, stdout, stderr)
+        Tuple of (success, stdout bytes, stderr)
     """
+    global _active_ffmpeg_runs
+    
+    is_ffmpeg = bool(cmd) and cmd[0] == "ffmpeg"
+    counted = False
+    
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            check=False
-        )
-        return result.returncode == 0, result.stdout, result.stderr
+        # FFmpeg writing to a file prints nothing useful on stdout
+        stdout_target = subprocess.PIPE
+        if is_ffmpeg:
+            with _active_ffmpeg_lock:
+                _active_ffmpeg_runs += 1
+                counted = True
+                threads = str(ffmpeg_thread_count(_active_ffmpeg_runs))
+            
+            # -threads before the inputs bounds decoding, before the output bounds
+            # encoding; -filter_threads bounds the filter graphs in between
+            cmd = [
+                cmd[0], *FFMPEG_QUIET_ARGS, "-filter_threads", threads, "-threads", threads,
+                *cmd[1:-1], "-threads", threads, cmd[-1]
+            ]
+            if not cmd[-1].startswith("pipe:"):
+                stdout_target = subprocess.DEVNULL
+        
+        # Without piped input, keep FFmpeg from polling the terminal for keys
+        stdin_args = {"input": input_data} if input_data is not None else {"stdin": subprocess.DEVNULL}
+        
+        with tempfile.TemporaryFile() as stderr_tmp:
+            result = subprocess.run(
+                cmd,
+                **stdin_args,
+                stdout=stdout_target,
+                stderr=stderr_tmp,
+                timeout=timeout,
+                check=False
+            )
+            
+            stderr = ""
+            if result.returncode != 0:
+                stderr_size = stderr_tmp.seek(0, os.SEEK_END)
+                stderr_tmp.seek(max(0, stderr_size - STDERR_TAIL_BYTES))
+                stderr = stderr_tmp.read().decode('utf-8', 'replace')
+        
+        return result.returncode == 0, result.stdout or b"", stderr
     except subprocess.TimeoutExpired:
-        return False, "", "Command timed out"
+        return False, b"", "Command timed out"
     except Exception as e:
-        return False, "", str(e)
+        return False, b"", str(e)
+    finally:
+        # Release the slot even if building the command failed
+        if counted:
+            with _active_ffmpeg_lock:
+                _active_ffmpeg_runs -= 1
+
+def run_ffmpeg_command(cmd: list, timeout: int = 300, input_data: Optional[bytes] = None) -> Tuple[bool, str, str]:
+    """
+    Run FFmpeg command and return success status and output
+    
+    Args:
+        cmd: FFmpeg command as list
+        timeout: Command timeout in seconds
+        input_data: Bytes fed to the command's stdin (for 'pipe:0' inputs)
+    
+    Returns:
+        Tuple of (success, stdout, stderr)
+    """
+    success, stdout, stderr = run_ffmpeg_pipe(cmd, timeout=timeout, input_data=input_data)
+    return success, stdout.decode('utf-8', 'replace'), stderr
 
 def detect_dat_format(input_path: str) -> Dict[str, Any]:
     """
@@ -80,6 +270,418 @@ def detect_dat_format(input_path: str) -> Dict[str, Any]:
         print(f"Error detecting DAT format: {e}")
         return {"sample_rate": 48000, "sample_format": "s16le", "channels": 2}
 
+def probe_audio_format(input_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the codec and format of the first audio stream
+    
+    Args:
+        input_path: Input media file path
+    
+    Returns:
+        Dictionary with codec, sample_rate, channels and bit_rate (None if
+        unknown), or None if it could not be determined
+    """
+    # PCM WAV headers are read in-process, sparing an ffprobe launch
+    if input_path.lower().endswith(".wav"):
+        try:
+            with wave.open(input_path, "rb") as wav:
+                sample_width = wav.getsampwidth()
+                return {
+                    "codec": "pcm_u8" if sample_width == 1 else f"pcm_s{sample_width * 8}le",
+                    "sample_rate": wav.getframerate(),
+                    "channels": wav.getnchannels(),
+                    "bit_rate": wav.getframerate() * wav.getnchannels() * sample_width * 8
+                }
+        except (wave.Error, EOFError, OSError):
+            # Non-PCM (e.g. float or extensible) WAV, let ffprobe handle it
+            pass
+    
+    try:
+        cmd = [
+            "ffprobe", "-v", "quiet", "-select_streams", "a:0",
+            "-show_entries", "stream=codec_name,sample_rate,channels,bit_rate",
+            "-print_format", "json", input_path
+        ]
+        
+        success, stdout, stderr = run_ffmpeg_command(cmd, timeout=30)
+        if not success:
+            return None
+        
+        streams = json.loads(stdout).get("streams", [])
+        if not streams:
+            return None
+        
+        stream = streams[0]
+        bit_rate = stream.get("bit_rate")
+        return {
+            "codec": stream.get("codec_name"),
+            "sample_rate": int(stream["sample_rate"]),
+            "channels": int(stream["channels"]),
+            "bit_rate": int(bit_rate) if bit_rate and bit_rate.isdigit() else None
+        }
+        
+    except Exception as e:
+        print(f"Error probing audio format: {e}")
+        return None
+
+@lru_cache(maxsize=1)
+def available_encoders() -> frozenset:
+    """
+    List the encoders compiled into the installed FFmpeg
+    
+    The result is cached: the FFmpeg build does not change mid-session.
+    
+    Returns:
+        Set of encoder names, empty if FFmpeg could not be queried
+    """
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=15,
+            check=False
+        )
+        # Encoder lines look like " A....D libmp3lame  ..."; the header ends at "------"
+        listing = result.stdout.decode('utf-8', 'replace').split(" ------", 1)[-1]
+        return frozenset(line.split()[1] for line in listing.splitlines() if len(line.split()) > 1)
+    except Exception:
+        return frozenset()
+
+def aac_encoder() -> str:
+    """
+    Pick the AAC encoder to use
+    
+    Returns:
+        libfdk_aac when the FFmpeg build includes it (non-free, faster and
+        better at a given bitrate), otherwise FFmpeg's native aac
+    """
+    return "libfdk_aac" if "libfdk_aac" in available_encoders() else "aac"
+
+@lru_cache(maxsize=None)
+def hw_encoder_works(encoder: str) -> bool:
+    """
+    Check if a hardware encoder is usable on this machine
+    
+    FFmpeg builds list NVENC/QSV/VAAPI encoders whether or not a GPU is
+    present, so this encodes a single blank frame to find out. The result is
+    cached for the life of the process.
+    
+    Args:
+        encoder: FFmpeg encoder name (e.g. h264_nvenc)
+    
+    Returns:
+        True if the encoder ran successfully, False otherwise
+    """
+    hw_args = hw_encoder_args(encoder, "23")
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        *hw_args["input"], "-f", "lavfi", "-i", "color=size=256x256:duration=0.1",
+        "-frames:v", "1"
+    ]
+    if hw_args["filters"]:
+        cmd.extend(["-vf", ",".join(hw_args["filters"])])
+    cmd.extend([*hw_args["output"], "-f", "null", "-"])
+    
+    try:
+        result = subprocess.run(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=15,
+            check=False
+        )
+        return result.returncode == 0
+    except Exception:
+        return False
+
+def select_hw_encoder(video_codec: str) -> Optional[str]:
+    """
+    Pick a working hardware encoder standing in for a software encoder
+    
+    Args:
+        video_codec: Software video encoder (libx264, libx265)
+    
+    Returns:
+        Hardware encoder name, or None if none is available
+    """
+    # Only encoders compiled into this FFmpeg build are worth a test encode
+    encoders = available_encoders()
+    for encoder in HW_ENCODERS.get(video_codec, []):
+        if encoder in encoders and hw_encoder_works(encoder):
+            return encoder
+    return None
+
+def hw_encoder_args(encoder: str, crf: str) -> Dict[str, list]:
+    """
+    Build the FFmpeg arguments for a hardware encoder
+    
+    Args:
+        encoder: Hardware encoder name
+        crf: x264-style quality value, mapped to the encoder's own CQ/QP scale
+    
+    Returns:
+        Dictionary with 'input' args (before -i), 'filters' appended to the
+        video filter chain and 'output' codec args
+    """
+    if encoder.endswith("_nvenc"):
+        return {
+            "input": [],
+            "filters": [],
+            "output": ["-c:v", encoder, "-preset", "p4", "-rc", "vbr", "-cq", crf, "-b:v", "0"]
+        }
+    if encoder.endswith("_qsv"):
+        return {
+            "input": [],
+            "filters": [],
+            "output": ["-c:v", encoder, "-global_quality", crf]
+        }
+    if encoder.endswith("_videotoolbox"):
+        # VideoToolbox quality runs 1-100 (higher is better); CRF 23 maps to 54
+        return {
+            "input": [],
+            "filters": [],
+            "output": ["-c:v", encoder, "-q:v", str(max(1, min(100, 100 - 2 * int(crf))))]
+        }
+    if encoder.endswith("_vaapi"):
+        # VAAPI encoders take frames from GPU memory, so upload after CPU filters
+        return {
+            "input": ["-vaapi_device", VAAPI_DEVICE],
+            "filters": ["format=nv12", "hwupload"],
+            "output": ["-c:v", encoder, "-rc_mode", "CQP", "-qp", crf]
+        }
+    return {"input": [], "filters": [], "output": ["-c:v", encoder]}
+
+def build_hw_pipeline(encoder: str, crf: str, scale: Optional[Tuple[int, int]] = None) -> Dict[str, list]:
+    """
+    Build FFmpeg arguments that keep frames in GPU memory end to end
+    
+    Decoding, scaling and encoding all run on the device, so frames are
+    never copied back to system memory. Only scaling is supported; other
+    filters need the CPU path from hw_encoder_args.
+    
+    Args:
+        encoder: Hardware encoder name
+        crf: x264-style quality value
+        scale: Target resolution (width, height), if resizing
+    
+    Returns:
+        Dictionary with 'input' args (before -i), 'filters' for the video
+        filter chain and 'output' codec args
+    """
+    output_args = hw_encoder_args(encoder, crf)["output"]
+    
+    if encoder.endswith("_nvenc"):
+        input_args = ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"]
+        filters = [f"scale_cuda={scale[0]}:{scale[1]}"] if scale else []
+    elif encoder.endswith("_qsv"):
+        input_args = ["-hwaccel", "qsv", "-hwaccel_output_format", "qsv"]
+        filters = [f"scale_qsv=w={scale[0]}:h={scale[1]}"] if scale else []
+    elif encoder.endswith("_vaapi"):
+        input_args = ["-hwaccel", "vaapi", "-hwaccel_device", VAAPI_DEVICE, "-hwaccel_output_format", "vaapi"]
+        filters = [f"scale_vaapi=w={scale[0]}:h={scale[1]}"] if scale else []
+    else:
+        return hw_encoder_args(encoder, crf)
+    
+    return {"input": input_args, "filters": filters, "output": output_args}
+
+def probe_stream_codecs(input_path: str) -> Dict[str, str]:
+    """
+    Read the codec of the first video and first audio stream
+    
+    Args:
+        input_path: Input media file path
+    
+    Returns:
+        Dictionary mapping 'video'/'audio' to codec names; streams that are
+        missing or could not be probed are left out
+    """
+    try:
+        cmd = [
+            "ffprobe", "-v", "quiet",
+            "-show_entries", "stream=codec_type,codec_name",
+            "-print_format", "json", input_path
+        ]
+        
+        success, stdout, stderr = run_ffmpeg_command(cmd, timeout=30)
+        if not success:
+            return {}
+        
+        codecs = {}
+        for stream in json.loads(stdout).get("streams", []):
+            codecs.setdefault(stream.get("codec_type"), stream.get("codec_name"))
+        return codecs
+        
+    except Exception as e:
+        print(f"Error probing stream codecs: {e}")
+        return {}
+
+def can_copy_audio(source_format: Optional[Dict[str, Any]], output_format: str, quality: str) -> bool:
+    """
+    Check whether the source audio stream can be copied instead of re-encoded
+    
+    Lossy sources are only copied when re-encoding could not lower their
+    bitrate to the requested one.
+    
+    Args:
+        source_format: Result of probe_audio_format
+        output_format: Output format (mp3, wav, flac, etc.)
+        quality: Requested audio bitrate
+    
+    Returns:
+        True if the stream can be copied, False otherwise
+    """
+    if not source_format or source_format["codec"] != STREAM_COPY_CODECS.get(output_format):
+        return False
+    
+    if output_format not in BITRATE_FORMATS:
+        return True
+    
+    try:
+        target_bit_rate = int(quality.rstrip("k")) * 1000
+    except ValueError:
+        return False
+    
+    return source_format["bit_rate"] is not None and source_format["bit_rate"] <= target_bit_rate
+
+def build_audio_command(
+    input_path: str,
+    output_target: str,
+    output_format: str,
+    quality: str = "192k",
+    sample_rate: int = 44100,
+    channels: int = 2,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    normalize: bool = False,
+    fade_in: float = 0.0,
+    fade_out: float = 0.0,
+    input_format: Optional[str] = None
+) -> list:
+    """
+    Build the FFmpeg command for an audio conversion
+    
+    Args:
+        input_path: Input audio file path
+        output_target: Output file path or FFmpeg pipe (e.g. 'pipe:1')
+        output_format: Output format (mp3, wav, flac, etc.)
+        quality: Audio quality/bitrate
+        sample_rate: Sample rate in Hz
+        channels: Number of audio channels
+        start_time: Start time in seconds
+        end_time: End time in seconds
+        normalize: Whether to normalize audio
+        fade_in: Fade in duration in seconds
+        fade_out: Fade out duration in seconds
+        input_format: Input format hint (e.g., 'dat' for DAT files)
+    
+    Returns:
+        FFmpeg command as list
+    """
+    # Base FFmpeg command
+    cmd = ["ffmpeg"]
+    
+    # Handle DAT files with special input format specification
+    if input_format == "dat":
+        # Detect DAT format parameters
+        dat_config = detect_dat_format(input_path)
+        
+        # Add DAT-specific input options
+        cmd.extend([
+            "-f", dat_config["sample_format"],  # Raw audio format
+            "-ar", str(dat_config["sample_rate"]),  # Sample rate
+            "-ac", str(dat_config["channels"]),  # Channels
+            "-i", input_path,
+            "-y"
+        ])
+        
+        print(f"Processing DAT file with config: {dat_config}")
+    else:
+        # Standard input handling
+        cmd.extend(["-i", input_path, "-y"])
+    
+    # Add input options
+    if start_time is not None:
+        cmd.extend(["-ss", str(start_time)])
+    if end_time is not None:
+        cmd.extend(["-to", str(end_time)])
+    
+    # Add audio processing filters
+    filters = []
+    
+    if normalize:
+        filters.append("loudnorm")
+    
+    if fade_in > 0:
+        filters.append(f"afade=t=in:st=0:d={fade_in}")
+    
+    if fade_out > 0:
+        # Calculate fade out start time
+        duration = end_time - start_time if start_time and end_time else None
+        if duration:
+            fade_start = duration - fade_out
+            filters.append(f"afade=t=out:st={fade_start}:d={fade_out}")
+    
+    # Apply filters if any
+    if filters:
+        cmd.extend(["-af", ",".join(filters)])
+    
+    # Only resample/remix when the source differs; loudnorm works at 192kHz
+    # internally, so normalized output always needs the explicit rate
+    source_format = None
+    if input_format != "dat" and not normalize and not input_path.startswith("pipe:"):
+        source_format = probe_audio_format(input_path)
+    
+    resample_args = []
+    if source_format is None or source_format["sample_rate"] != sample_rate:
+        resample_args.extend(["-ar", str(sample_rate)])
+    if source_format is None or source_format["channels"] != channels:
+        resample_args.extend(["-ac", str(channels)])
+    
+    # A source already in the target codec that needs no processing is copied
+    stream_copy = (
+        not filters and not resample_args and start_time is None and end_time is None
+        and can_copy_audio(source_format, output_format, quality)
+    )
+    
+    # Add output options based on format
+    if stream_copy:
+        # Copy the probed stream itself; FFmpeg's default pick among several
+        # audio tracks need not be the first one
+        cmd.extend(["-map", "0:a:0", "-vn", "-acodec", "copy"])
+    elif output_format == "mp3":
+        # VBR spends fewer bits (and quantization passes) on silence and simple passages.
+        # The muxer writes the Xing header only by seeking back in the output, so
+        # pipes get CBR, whose duration players can work out without it.
+        if quality in MP3_VBR_QUALITY and not output_target.startswith("pipe:"):
+            cmd.extend(["-vn", "-acodec", "libmp3lame", "-compression_level", MP3_VBR_ALGORITHM_QUALITY,
+                        "-q:a", MP3_VBR_QUALITY[quality], *resample_args])
+        else:
+            cmd.extend(["-vn", "-acodec", "libmp3lame", "-compression_level", MP3_CBR_ALGORITHM_QUALITY,
+                        "-ab", quality, *resample_args])
+    elif output_format == "wav":
+        cmd.extend(["-vn", "-acodec", "pcm_s16le", *resample_args])
+    elif output_format == "flac":
+        cmd.extend(["-vn", "-acodec", "flac", *resample_args])
+    elif output_format == "aac":
+        cmd.extend(["-vn", "-acodec", aac_encoder(), "-b:a", quality, *resample_args])
+    elif output_format == "ogg":
+        cmd.extend(["-vn", "-acodec", "libvorbis", *resample_args])
+    else:
+        # Default to copy codec
+        cmd.extend(["-vn", "-acodec", "copy"])
+    
+    # A pipe has no extension to infer the container from
+    if output_target.startswith("pipe:"):
+        cmd.extend(["-f", PIPE_MUXERS.get(output_format, output_format)])
+    
+    # Add output path
+    cmd.append(output_target)
+    
+    return cmd
+
 def convert_audio(
     input_path: str,
     output_path: str,
@@ -92,7 +694,8 @@ def convert_audio(
     normalize: bool = False,
     fade_in: float = 0.0,
     fade_out: float = 0.0,
-    input_format: Optional[str] = None
+    input_format: Optional[str] = None,
+    input_data: Optional[bytes] = None
 ) -> bool:
     """
     Convert audio file using FFmpeg
@@ -110,79 +713,20 @@ def convert_audio(
         fade_in: Fade in duration in seconds
         fade_out: Fade out duration in seconds
         input_format: Input format hint (e.g., 'dat' for DAT files)
+        input_data: Input file contents to pipe into FFmpeg when input_path
+            is 'pipe:0' (input formats listed in PIPE_DEMUXERS)
     
     Returns:
         True if conversion successful, False otherwise
     """
     try:
-        # Base FFmpeg command
-        cmd = ["ffmpeg"]
-        
-        # Handle DAT files with special input format specification
-        if input_format == "dat":
-            # Detect DAT format parameters
-            dat_config = detect_dat_format(input_path)
-            
-            # Add DAT-specific input options
-            cmd.extend([
-                "-f", dat_config["sample_format"],  # Raw audio format
-                "-ar", str(dat_config["sample_rate"]),  # Sample rate
-                "-ac", str(dat_config["channels"]),  # Channels
-                "-i", input_path,
-                "-y"
-            ])
-            
-            print(f"Processing DAT file with config: {dat_config}")
-        else:
-            # Standard input handling
-            cmd.extend(["-i", input_path, "-y"])
-        
-        # Add input options
-        if start_time is not None:
-            cmd.extend(["-ss", str(start_time)])
-        if end_time is not None:
-            cmd.extend(["-to", str(end_time)])
-        
-        # Add audio processing filters
-        filters = []
-        
-        if normalize:
-            filters.append("loudnorm")
-        
-        if fade_in > 0:
-            filters.append(f"afade=t=in:st=0:d={fade_in}")
-        
-        if fade_out > 0:
-            # Calculate fade out start time
-            duration = end_time - start_time if start_time and end_time else None
-            if duration:
-                fade_start = duration - fade_out
-                filters.append(f"afade=t=out:st={fade_start}:d={fade_out}")
-        
-        # Apply filters if any
-        if filters:
-            cmd.extend(["-af", ",".join(filters)])
-        
-        # Add output options based on format
-        if output_format == "mp3":
-            cmd.extend(["-vn", "-acodec", "libmp3lame", "-ab", quality, "-ar", str(sample_rate), "-ac", str(channels)])
-        elif output_format == "wav":
-            cmd.extend(["-vn", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-ac", str(channels)])
-        elif output_format == "flac":
-            cmd.extend(["-vn", "-acodec", "flac", "-ar", str(sample_rate), "-ac", str(channels)])
-        elif output_format == "aac":
-            cmd.extend(["-vn", "-acodec", "aac", "-b:a", quality, "-ar", str(sample_rate), "-ac", str(channels)])
-        elif output_format == "ogg":
-            cmd.extend(["-vn", "-acodec", "libvorbis", "-ar", str(sample_rate), "-ac", str(channels)])
-        else:
-            # Default to copy codec
-            cmd.extend(["-vn", "-acodec", "copy"])
-        
-        # Add output path
-        cmd.append(output_path)
+        cmd = build_audio_command(
+            input_path, output_path, output_format, quality, sample_rate, channels,
+            start_time, end_time, normalize, fade_in, fade_out, input_format
+        )
         
         # Run conversion
-        success, stdout, stderr = run_ffmpeg_command(cmd)
+        success, stdout, stderr = run_ffmpeg_command(cmd, input_data=input_data)
         
         if not success:
             print(f"FFmpeg error: {stderr}")
@@ -197,6 +741,211 @@ def convert_audio(
         print(f"Error in convert_audio: {e}")
         return False
 
+def convert_audio_to_bytes(
+    input_path: str,
+    output_format: str,
+    quality: str = "192k",
+    sample_rate: int = 44100,
+    channels: int = 2,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    normalize: bool = False,
+    fade_in: float = 0.0,
+    fade_out: float = 0.0,
+    input_data: Optional[bytes] = None
+) -> Optional[bytes]:
+    """
+    Convert audio file using FFmpeg, returning the output in memory
+    
+    The encoded audio is read from FFmpeg's stdout instead of being written
+    to disk and read back. Only formats listed in PIPE_MUXERS are supported.
+    When input_data is given it is fed to FFmpeg's stdin, so the input never
+    touches disk either (input formats listed in PIPE_DEMUXERS). MP3 is
+    encoded CBR here, since a VBR file needs a header FFmpeg cannot write
+    to a pipe.
+    
+    Args:
+        input_path: Input audio file path, or 'pipe:0' together with input_data
+        output_format: Output format (mp3, aac, ogg)
+        quality: Audio quality/bitrate
+        sample_rate: Sample rate in Hz
+        channels: Number of audio channels
+        start_time: Start time in seconds
+        end_time: End time in seconds
+        normalize: Whether to normalize audio
+        fade_in: Fade in duration in seconds
+        fade_out: Fade out duration in seconds
+        input_data: Input file contents to pipe into FFmpeg
+    
+    Returns:
+        Encoded audio bytes or None if conversion failed
+    """
+    try:
+        cmd = build_audio_command(
+            input_path, "pipe:1", output_format, quality, sample_rate, channels,
+            start_time, end_time, normalize, fade_in, fade_out
+        )
+        
+        success, stdout, stderr = run_ffmpeg_pipe(cmd, input_data=input_data)
+        
+        if not success or not stdout:
+            print(f"FFmpeg error: {stderr}")
+            return None
+        
+        return stdout
+        
+    except Exception as e:
+        print(f"Error in convert_audio_to_bytes: {e}")
+        return None
+
+def encode_wav_to_mp3(
+    input_path: str,
+    output_path: str,
+    quality: str = "192k",
+    sample_rate: int = 44100,
+    channels: int = 2
+) -> bool:
+    """
+    Encode a 16-bit PCM WAV file to MP3 in-process with LAME
+    
+    Avoids spawning FFmpeg for the plain WAV to MP3 case. Only applies when
+    lameenc is installed and the WAV already has the requested sample rate
+    and channel count, since no resampling or remixing is done here.
+    
+    Args:
+        input_path: Input WAV file path
+        output_path: Output MP3 file path
+        quality: Audio quality/bitrate
+        sample_rate: Required sample rate in Hz
+        channels: Required number of audio channels
+    
+    Returns:
+        True if the file was encoded, False if the caller should fall back to FFmpeg
+    """
+    if lameenc is None:
+        return False
+    
+    try:
+        with wave.open(input_path, 'rb') as wav:
+            if (wav.getsampwidth() != 2 or wav.getframerate() != sample_rate
+                    or wav.getnchannels() != channels):
+                return False
+            
+            encoder = lameenc.Encoder()
+            # Same bitrate mode as the FFmpeg MP3 path: VBR for mapped presets.
+            # set_vbr(4) selects LAME's default VBR mode; without it the
+            # encoder stays CBR and ignores the VBR quality.
+            vbr = quality in MP3_VBR_QUALITY
+            if vbr:
+                encoder.set_vbr(4)
+                encoder.set_vbr_quality(int(MP3_VBR_QUALITY[quality]))
+                encoder.set_quality(int(MP3_VBR_ALGORITHM_QUALITY))
+            else:
+                encoder.set_bit_rate(int(quality.rstrip('k')))
+                encoder.set_quality(int(MP3_CBR_ALGORITHM_QUALITY))
+            encoder.set_in_sample_rate(sample_rate)
+            encoder.set_channels(channels)
+            
+            with open(output_path, 'wb') as out:
+                while True:
+                    frames = wav.readframes(WAV_CHUNK_FRAMES)
+                    if not frames:
+                        break
+                    out.write(encoder.encode(frames))
+                out.write(encoder.flush())
+        
+        # lameenc writes no Xing header, without which players guess a VBR
+        # file's duration from its first frame and seek badly
+        if vbr:
+            add_xing_header(output_path)
+        
+        return True
+    
+    except Exception as e:
+        print(f"Error in encode_wav_to_mp3: {e}")
+        return False
+
+def mp3_frame_length(header: bytes) -> int:
+    """Length in bytes of the Layer III frame starting with header, 0 if it is not one"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return 0
+    
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if (version not in MP3_FRAME_SAMPLE_RATES or layer != 1
+            or bitrate_index in (0, 15) or sample_rate_index == 3):
+        return 0
+    
+    bitrate = MP3_FRAME_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = MP3_FRAME_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    # MPEG-2/2.5 Layer III frames carry half as many samples
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+def add_xing_header(mp3_path: str) -> bool:
+    """
+    Prepend a Xing header frame to a VBR MP3 file
+    
+    The header records the frame and byte counts, which players use for the
+    duration and for seeking. It is an empty audio frame, so players that
+    ignore it only decode a frame of silence.
+    
+    Args:
+        mp3_path: MP3 file without ID3 tags or an existing Xing header
+    
+    Returns:
+        True if the header was written
+    """
+    try:
+        data = Path(mp3_path).read_bytes()
+        
+        frame_count = 0
+        offset = 0
+        while offset < len(data):
+            frame_length = mp3_frame_length(data[offset:offset + 4])
+            if not frame_length:
+                break
+            frame_count += 1
+            offset += frame_length
+        
+        if not frame_count:
+            return False
+        
+        # Same stream parameters as the audio, no CRC and no padding
+        header = bytearray(data[:4])
+        header[1] |= 0x01
+        header[2] &= 0xFC
+        version = (header[1] >> 3) & 0x03
+        mono = (header[3] >> 6) == 3
+        if version == 3:
+            side_info_length = 17 if mono else 32
+        else:
+            side_info_length = 9 if mono else 17
+        
+        # Smallest bitrate whose frame fits the header and the Xing tag
+        for bitrate_index in range(1, 15):
+            header[2] = (header[2] & 0x0F) | (bitrate_index << 4)
+            frame_length = mp3_frame_length(bytes(header))
+            if frame_length >= 4 + side_info_length + 16:
+                break
+        
+        # Flags 0x03: frame count and byte count present
+        tag = bytes(header) + bytes(side_info_length) + b"Xing" + struct.pack(
+            ">III", 0x03, frame_count, len(data) + frame_length
+        )
+        
+        with open(mp3_path, 'wb') as out:
+            out.write(tag.ljust(frame_length, b"\0"))
+            out.write(data)
+        
+        return True
+    
+    except Exception as e:
+        print(f"Error in add_xing_header: {e}")
+        return False
+
 def convert_dat_alternative(
     input_path: str,
     output_path: str,
@@ -252,11 +1001,12 @@ def convert_dat_alternative(
             
             # Add output format options
             if output_format == "mp3":
-                cmd.extend(["-acodec", "libmp3lame", "-ab", quality, "-ar", str(sample_rate), "-ac", str(channels)])
+                cmd.extend(["-acodec", "libmp3lame", "-compression_level", MP3_CBR_ALGORITHM_QUALITY,
+                            "-ab", quality, "-ar", str(sample_rate), "-ac", str(channels)])
             elif output_format == "wav":
                 cmd.extend(["-acodec", "pcm_s16le", "-ar", str(sample_rate), "-ac", str(channels)])
             else:
-                cmd.extend(["-acodec", "libmp3lame", "-ab", quality])
+                cmd.extend(["-acodec", "libmp3lame", "-compression_level", MP3_CBR_ALGORITHM_QUALITY, "-ab", quality])
             
             cmd.append(output_path)
             
@@ -286,7 +1036,8 @@ def convert_video(
     audio_codec: str = "aac",
     video_codec: str = "libx264",
     two_pass: bool = False,
-    deinterlace: bool = False
+    deinterlace: bool = False,
+    use_gpu: bool = False
 ) -> bool:
     """
     Convert video file using FFmpeg
@@ -306,19 +1057,18 @@ def convert_video(
         video_codec: Video codec to use
         two_pass: Whether to use two-pass encoding
         deinterlace: Whether to deinterlace video
+        use_gpu: Whether to use a hardware encoder when one is available
     
     Returns:
         True if conversion successful, False otherwise
     """
     try:
-        # Base FFmpeg command
-        cmd = ["ffmpeg", "-i", input_path, "-y"]
-        
         # Add input options
+        trim_args = []
         if start_time is not None:
-            cmd.extend(["-ss", str(start_time)])
+            trim_args.extend(["-ss", str(start_time)])
         if end_time is not None:
-            cmd.extend(["-to", str(end_time)])
+            trim_args.extend(["-to", str(end_time)])
         
         # Add video processing filters
         filters = []
@@ -335,48 +1085,86 @@ def convert_video(
         if fps:
             filters.append(f"fps={fps}")
         
-        # Apply filters if any
-        if filters:
-            cmd.extend(["-vf", ",".join(filters)])
+        # Streams already in the requested codec are remuxed rather than
+        # re-encoded, unless they are filtered or trimmed
+        source_codecs = {}
+        if start_time is None and end_time is None:
+            source_codecs = probe_stream_codecs(input_path)
+        source_video = source_codecs.get("video")
+        source_audio = source_codecs.get("audio")
+        copy_video = not filters and source_video is not None and source_video == VIDEO_COPY_CODECS.get(video_codec)
+        copy_audio = source_audio is not None and source_audio == AUDIO_COPY_CODECS.get(audio_codec)
+        
+        quality_settings = {
+            "ultrafast": {"crf": "28", "preset": "ultrafast"},
+            "fast": {"crf": "26", "preset": "fast"},
+            "medium": {"crf": "23", "preset": "medium"},
+            "slow": {"crf": "20", "preset": "slow"},
+            "high": {"crf": "18", "preset": "slow"}
+        }
         
         # Add video codec options
-        if video_codec == "libx264":
-            quality_settings = {
-                "ultrafast": {"crf": "28", "preset": "ultrafast"},
-                "fast": {"crf": "26", "preset": "fast"},
-                "medium": {"crf": "23", "preset": "medium"},
-                "slow": {"crf": "20", "preset": "slow"},
-                "high": {"crf": "18", "preset": "slow"}
-            }
-            
+        if copy_video:
+            video_args = ["-c:v", "copy"]
+        
+        elif video_codec == "libx264":
             if quality_preset in quality_settings:
                 settings = quality_settings[quality_preset]
-                cmd.extend(["-c:v", video_codec, "-crf", settings["crf"], "-preset", settings["preset"]])
+                video_args = ["-c:v", video_codec, "-crf", settings["crf"], "-preset", settings["preset"]]
             else:
-                cmd.extend(["-c:v", video_codec, "-crf", "23", "-preset", "medium"])
+                video_args = ["-c:v", video_codec, "-crf", "23", "-preset", "medium"]
         
         elif video_codec == "libx265":
-            cmd.extend(["-c:v", video_codec, "-crf", "28", "-preset", "medium"])
+            video_args = ["-c:v", video_codec, "-crf", "28", "-preset", "medium"]
         
         elif video_codec == "libvpx-vp9":
-            cmd.extend(["-c:v", video_codec, "-crf", "30", "-b:v", "0"])
+            video_args = ["-c:v", video_codec, "-crf", "30", "-b:v", "0"]
         
         else:
-            cmd.extend(["-c:v", video_codec])
+            video_args = ["-c:v", video_codec]
         
         # Add audio codec options
-        if audio_codec == "copy":
-            cmd.extend(["-c:a", "copy"])
+        if audio_codec == "copy" or copy_audio:
+            output_args = ["-c:a", "copy"]
         elif audio_codec == "none":
-            cmd.extend(["-an"])
+            output_args = ["-an"]
         else:
-            cmd.extend(["-c:a", audio_codec])
+            output_args = ["-c:a", audio_codec]
         
-        # Add output path
-        cmd.append(output_path)
+        if output_format in FASTSTART_FORMATS:
+            output_args.extend(["-movflags", "+faststart"])
         
-        # Run conversion
-        success, stdout, stderr = run_ffmpeg_command(cmd)
+        # Each attempt is (args before -i, video filters, video codec args).
+        # GPU attempts come first; the software encode is the last resort.
+        attempts = []
+        hw_encoder = None
+        if use_gpu and not copy_video:
+            hw_encoder = select_hw_encoder(video_codec)
+        if hw_encoder:
+            crf = quality_settings.get(quality_preset, {"crf": "23"})["crf"] if video_codec == "libx264" else "28"
+            
+            # Without CPU-only filters, frames can stay in GPU memory from decode to encode
+            if not deinterlace and not (crop_width and crop_height) and not fps:
+                pipeline = build_hw_pipeline(hw_encoder, crf, resolution)
+                attempts.append((pipeline["input"], pipeline["filters"], pipeline["output"]))
+            
+            hw_args = hw_encoder_args(hw_encoder, crf)
+            attempts.append((hw_args["input"], filters + hw_args["filters"], hw_args["output"]))
+        attempts.append(([], filters, video_args))
+        
+        for pre_input_args, video_filters, codec_args in attempts:
+            cmd = ["ffmpeg", *pre_input_args, "-i", input_path, "-y", *trim_args]
+            
+            # Apply filters if any
+            if video_filters:
+                cmd.extend(["-vf", ",".join(video_filters)])
+            
+            cmd.extend([*codec_args, *output_args, output_path])
+            
+            # Run conversion
+            success, stdout, stderr = run_ffmpeg_command(cmd)
+            if success:
+                break
         
         if not success:
             print(f"FFmpeg error: {stderr}")
@@ -425,7 +1213,9 @@ def compress_video(
     crf: str = "25",
     preset: str = "medium",
     target_size_mb: Optional[int] = None,
-    maintain_quality: bool = False
+    maintain_quality: bool = False,
+    use_gpu: bool = False,
+    input_data: Optional[bytes] = None
 ) -> bool:
     """
     Compress video file to reduce size
@@ -438,31 +1228,46 @@ def compress_video(
         preset: Encoding preset (ultrafast, fast, medium, slow, slower)
         target_size_mb: Target file size in MB
         maintain_quality: Whether to prioritize quality over size
+        use_gpu: Whether to use a hardware encoder when one is available
+        input_data: Input file contents to pipe into FFmpeg (input_path 'pipe:0')
     
     Returns:
         True if compression successful, False otherwise
     """
     try:
-        # Base FFmpeg command
-        cmd = ["ffmpeg", "-i", input_path, "-y"]
-        
         # Adjust CRF based on quality preference
         if maintain_quality:
             crf = str(max(18, int(crf) - 5))  # Better quality
         else:
             crf = str(min(35, int(crf) + 5))   # Smaller file
         
-        # Add video codec options
-        cmd.extend(["-c:v", "libx264", "-crf", crf, "-preset", preset])
-        
         # Add audio codec
-        cmd.extend(["-c:a", "aac", "-b:a", "128k"])
+        output_args = ["-c:a", "aac", "-b:a", "128k"]
+        
+        if output_format in FASTSTART_FORMATS:
+            output_args.extend(["-movflags", "+faststart"])
         
-        # Add output path
-        cmd.append(output_path)
+        # Add video codec options: decode and encode on the GPU when asked and
+        # available, then GPU encode only, then the software encoder
+        attempts = []
+        hw_encoder = select_hw_encoder("libx264") if use_gpu else None
+        if hw_encoder:
+            pipeline = build_hw_pipeline(hw_encoder, crf)
+            hw_args = hw_encoder_args(hw_encoder, crf)
+            attempts.append((pipeline["input"], pipeline["filters"], pipeline["output"]))
+            attempts.append((hw_args["input"], hw_args["filters"], hw_args["output"]))
+        attempts.append(([], [], ["-c:v", "libx264", "-crf", crf, "-preset", preset]))
         
-        # Run compression
-        success, stdout, stderr = run_ffmpeg_command(cmd)
+        for pre_input_args, video_filters, codec_args in attempts:
+            cmd = ["ffmpeg", *pre_input_args, "-i", input_path, "-y"]
+            if video_filters:
+                cmd.extend(["-vf", ",".join(video_filters)])
+            cmd.extend([*codec_args, *output_args, output_path])
+            
+            # Run compression
+            success, stdout, stderr = run_ffmpeg_command(cmd, input_data=input_data)
+            if success:
+                break
         
         if not success:
             print(f"FFmpeg error: {stderr}")
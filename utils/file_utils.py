@@ -4,8 +4,17 @@ import json
 import subprocess
 import tempfile
 import shutil
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Optional, Tuple, Any
+from typing import Dict, Optional, Tuple, Any, Iterator
+
+from config import APP_CONFIG
+
+# Tables used by sanitize_filename, built once at import. Invalid characters
+# are dropped with str.translate, a single table lookup per character.
+_FN_BAD = str.maketrans('', '', '<>:"/\\|?*')
+_FN_WS = re.compile(r'\s+')
 
 def sanitize_filename(filename: str, max_length: int = 100) -> str:
     """
@@ -18,12 +27,8 @@ def sanitize_filename(filename: str, max_length: int = 100) -> str:
     Returns:
         Sanitized filename
     """
-    # Remove invalid characters
-    filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-    # Replace multiple spaces with single space
-    filename = re.sub(r'\s+', ' ', filename)
-    # Strip whitespace
-    filename = filename.strip()
+    # Remove invalid characters, collapse whitespace runs and strip the ends
+    filename = _FN_WS.sub(' ', filename.translate(_FN_BAD)).strip()
     
     # Limit length
     if len(filename) > max_length:
@@ -34,23 +39,17 @@ def sanitize_filename(filename: str, max_length: int = 100) -> str:
     
     return filename
 
+@lru_cache(maxsize=1)
 def check_ffmpeg() -> bool:
     """
     Check if FFmpeg is available in system PATH
     
+    The result is cached: the binary does not appear or vanish mid-session.
+    
     Returns:
         True if FFmpeg is available, False otherwise
     """
-    try:
-        result = subprocess.run(
-            ['ffmpeg', '-version'], 
-            capture_output=True, 
-            check=True,
-            timeout=10
-        )
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
-        return False
+    return shutil.which('ffmpeg') is not None
 
 def get_file_info(file_path: str) -> Optional[Dict[str, Any]]:
     """
@@ -71,11 +70,11 @@ def get_file_info(file_path: str) -> Optional[Dict[str, Any]]:
         result = subprocess.run(
             cmd, 
             capture_output=True, 
-            text=True, 
             check=True,
             timeout=30
         )
         
+        # json.loads detects the encoding of raw bytes itself, no need to decode first
         info = json.loads(result.stdout)
         
         # Extract basic information
@@ -87,9 +86,15 @@ def get_file_info(file_path: str) -> Optional[Dict[str, Any]]:
         format_name = format_info.get('format_name', 'unknown')
         file_size = int(format_info.get('size', 0))
         
-        # Analyze streams
-        video_streams = [s for s in streams if s.get('codec_type') == 'video']
-        audio_streams = [s for s in streams if s.get('codec_type') == 'audio']
+        # Analyze streams, sorting them by type in a single pass
+        video_streams = []
+        audio_streams = []
+        for stream in streams:
+            codec_type = stream.get('codec_type')
+            if codec_type == 'video':
+                video_streams.append(stream)
+            elif codec_type == 'audio':
+                audio_streams.append(stream)
         
         has_video = len(video_streams) > 0
         has_audio = len(audio_streams) > 0
@@ -180,6 +185,9 @@ def format_duration(seconds: float) -> str:
     else:
         return f"{minutes:02d}:{seconds:02d}"
 
+# Size units checked largest first, as (suffix, threshold in bytes)
+_SIZE_UNITS = (("GB", 1 << 30), ("MB", 1 << 20), ("KB", 1 << 10))
+
 def format_file_size(size_bytes: int) -> str:
     """
     Format file size in appropriate units
@@ -190,14 +198,46 @@ def format_file_size(size_bytes: int) -> str:
     Returns:
         Formatted file size string
     """
-    if size_bytes >= 1024**3:  # >= 1GB
-        return f"{size_bytes / (1024**3):.2f} GB"
-    elif size_bytes >= 1024**2:  # >= 1MB
-        return f"{size_bytes / (1024**2):.2f} MB"
-    elif size_bytes >= 1024:  # >= 1KB
-        return f"{size_bytes / 1024:.1f} KB"
-    else:
-        return f"{size_bytes} bytes"
+    for unit, threshold in _SIZE_UNITS:
+        if size_bytes >= threshold:
+            return f"{size_bytes / threshold:.2f} {unit}"
+    return f"{size_bytes} bytes"
+
+@lru_cache(maxsize=1)
+def tmpfs_available() -> bool:
+    """
+    Check if the configured tmpfs directory exists and is writable
+    
+    Returns:
+        True if temporary files can be placed on tmpfs, False otherwise
+    """
+    tmpfs_dir = APP_CONFIG["tmpfs_dir"]
+    return os.path.isdir(tmpfs_dir) and os.access(tmpfs_dir, os.W_OK)
+
+def temp_parent_dir(size_bytes: int) -> Optional[str]:
+    """
+    Choose where a temporary directory holding size_bytes of data should go
+    
+    Small data goes to tmpfs so short conversions never touch the disk;
+    anything larger, or more than half of the free tmpfs space, stays in
+    the system temp directory.
+    
+    Args:
+        size_bytes: Amount of data that will be written
+    
+    Returns:
+        tmpfs directory path, or None for the system default
+    """
+    if size_bytes > APP_CONFIG["tmpfs_max_size"] or not tmpfs_available():
+        return None
+    
+    try:
+        if shutil.disk_usage(APP_CONFIG["tmpfs_dir"]).free > 2 * size_bytes:
+            return APP_CONFIG["tmpfs_dir"]
+    except OSError:
+        pass
+    
+    return None
 
 def create_temp_dir(prefix: str = "media_converter_") -> str:
     """
@@ -211,6 +251,28 @@ def create_temp_dir(prefix: str = "media_converter_") -> str:
     """
     return tempfile.mkdtemp(prefix=prefix)
 
+@contextmanager
+def save_upload_to_temp(uploaded_file, prefix: str = "media_converter_") -> Iterator[str]:
+    """
+    Write an uploaded file into a temporary directory for processing
+    
+    The directory and its contents are removed when the context exits,
+    including when processing raises. Small uploads are written to tmpfs
+    when available.
+    
+    Args:
+        uploaded_file: Streamlit UploadedFile
+        prefix: Prefix for temporary directory name
+    
+    Yields:
+        Path to the temporary copy of the upload
+    """
+    with tempfile.TemporaryDirectory(prefix=prefix, dir=temp_parent_dir(uploaded_file.size)) as temp_dir:
+        input_path = os.path.join(temp_dir, f"input{Path(uploaded_file.name).suffix}")
+        with open(input_path, 'wb') as f:
+            f.write(uploaded_file.getbuffer())
+        yield input_path
+
 def cleanup_temp_dir(temp_dir: str) -> bool:
     """
     Clean up temporary directory and all contents
@@ -1,18 +1,138 @@
 import os
+import re
+import shutil
 import tempfile
 import yt_dlp
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any
-import subprocess
+from typing import Optional, Dict, Any, Callable
 
 from config import YT_DLP_OPTIONS, QUALITY_PRESETS
+from utils.ffmped_utils import (
+    run_ffmpeg_command, FASTSTART_FORMATS, MP3_CBR_ALGORITHM_QUALITY,
+    MP3_VBR_ALGORITHM_QUALITY, MP3_VBR_QUALITY, aac_encoder
+)
+
+# Download filename; titles are capped at 100 bytes so long titles stay within filesystem name limits
+YOUTUBE_OUTTMPL = '%(title).100B.%(ext)s'
+
+# YouTube watch, short and share URLs, compiled once at import
+_YOUTUBE_URL = re.compile(r'^https?://(?:(?:www|m|music)\.)?(?:youtube\.com|youtu\.be)/', re.IGNORECASE)
+
+def is_youtube_url(url: str) -> bool:
+    """
+    Check whether a URL points at YouTube
+    
+    Args:
+        url: URL entered by the user
+    
+    Returns:
+        True if the URL is a YouTube URL, False otherwise
+    """
+    return _YOUTUBE_URL.match(url) is not None
+
+@lru_cache(maxsize=1)
+def external_downloader_options() -> Dict[str, Any]:
+    """
+    Get the yt-dlp options for an external downloader, if one is installed
+    
+    The PATH lookup is cached: the binary does not appear or vanish mid-session.
+    
+    Returns:
+        aria2c options when aria2c is on PATH, otherwise an empty dict
+    """
+    if shutil.which('aria2c'):
+        return YT_DLP_OPTIONS["aria2c"]
+    return {}
+
+def extract_and_download(
+    ydl: yt_dlp.YoutubeDL,
+    url: str,
+    info: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Download a URL, reusing already extracted info when available
+    
+    Only the extraction is reused; format selection always runs here, with
+    the download's own format option.
+    
+    Args:
+        ydl: YoutubeDL instance configured for the download
+        url: YouTube video URL
+        info: Info dict from an earlier
+            extract_info(url, download=False, process=False)
+    
+    Returns:
+        Info dict of the finished download
+    """
+    if info is None:
+        return ydl.extract_info(url, download=True)
+    
+    # Drop any results of an earlier processing pass (requested_formats,
+    # requested_downloads, ...) the way --load-info-json does, so they cannot
+    # override this download's format selection. This also returns a copy,
+    # keeping the caller's dict reusable.
+    info = yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True)
+    return ydl.process_ie_result(info, download=True)
+
+def get_downloaded_path(
+    ydl: yt_dlp.YoutubeDL,
+    info: Dict[str, Any],
+    extension: Optional[str] = None
+) -> Optional[Path]:
+    """
+    Get the on-disk path of a finished yt-dlp download
+    
+    Uses the path yt-dlp reports for the download instead of scanning the
+    output directory, which could also pick up another download's file.
+    
+    Args:
+        ydl: YoutubeDL instance that performed the download
+        info: Info dict returned by extract_info
+        extension: Extension the postprocessor converted to, if any
+    
+    Returns:
+        Path to the downloaded file or None if it does not exist
+    """
+    downloads = info.get('requested_downloads') or []
+    if downloads and downloads[-1].get('filepath'):
+        path = Path(downloads[-1]['filepath'])
+    else:
+        path = Path(ydl.prepare_filename(info))
+        if extension:
+            path = path.with_suffix(f'.{extension}')
+    
+    return path if path.exists() else None
+
+def make_progress_hook(progress: Dict[str, float]) -> Callable[[Dict[str, Any]], None]:
+    """
+    Build a yt-dlp progress hook that records the downloaded fraction
+    
+    Args:
+        progress: Mapping updated with a 'fraction' key between 0 and 1;
+            may be a multiprocessing manager dict shared with the UI
+    
+    Returns:
+        Hook function for yt-dlp's progress_hooks option
+    """
+    def hook(d: Dict[str, Any]) -> None:
+        if d['status'] == 'downloading':
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total:
+                progress['fraction'] = min(d.get('downloaded_bytes', 0) / total, 1.0)
+        elif d['status'] == 'finished':
+            progress['fraction'] = 1.0
+    
+    return hook
 
 def download_youtube_audio(
     url: str,
     output_format: str = "mp3",
     quality: str = "192k",
     start_time: Optional[str] = None,
-    end_time: Optional[str] = None
+    end_time: Optional[str] = None,
+    info: Optional[Dict[str, Any]] = None,
+    progress: Optional[Dict[str, float]] = None
 ) -> Optional[str]:
     """
     Download YouTube video and convert to audio format
@@ -23,6 +143,9 @@ def download_youtube_audio(
         quality: Audio quality/bitrate
         start_time: Start time for trimming (HH:MM:SS)
         end_time: End time for trimming (HH:MM:SS)
+        info: Info dict from an earlier extract_info(url, download=False);
+            reusing it skips a second metadata fetch
+        progress: Mapping to record download progress in (see make_progress_hook)
     
     Returns:
         Path to downloaded audio file or None if failed
@@ -32,47 +155,50 @@ def download_youtube_audio(
         output_dir = Path("downloads")
         output_dir.mkdir(exist_ok=True)
         
+        trim = bool(start_time or end_time)
+        
         # Configure yt-dlp options
         ydl_opts = YT_DLP_OPTIONS["base"].copy()
         ydl_opts.update({
-            'format': 'bestaudio/best',
-            'outtmpl': str(output_dir / '%(title)s.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': output_format,
-                'preferredquality': quality.replace('k', ''),
-            }],
+            'format': YT_DLP_OPTIONS["audio"]["format"],
+            'outtmpl': str(output_dir / YOUTUBE_OUTTMPL),
             'quiet': True,
             'no_warnings': True
         })
+        ydl_opts.update(external_downloader_options())
+        
+        if progress is not None:
+            ydl_opts['progress_hooks'] = [make_progress_hook(progress)]
+        
+        # When trimming, the trim pass decodes the original stream and encodes
+        # the target format itself, so yt-dlp's extraction pass would be wasted
+        if not trim:
+            # yt-dlp treats qualities below 10 as LAME VBR levels; an AAC
+            # source is copied rather than re-encoded when aac is requested
+            preferred_quality = quality.replace('k', '')
+            if output_format == "mp3" and quality in MP3_VBR_QUALITY:
+                preferred_quality = MP3_VBR_QUALITY[quality]
+            
+            ydl_opts['postprocessors'] = [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': output_format,
+                'preferredquality': preferred_quality,
+            }]
         
         # Download audio
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            video_title = info.get('title', 'Unknown')
-            
-            # Find the downloaded file
-            downloaded_file = None
-            for file in output_dir.iterdir():
-                if file.suffix == f'.{output_format}' and video_title.lower() in file.name.lower():
-                    downloaded_file = file
-                    break
-            
-            if not downloaded_file:
-                # Try to find any file with the correct extension
-                for file in output_dir.iterdir():
-                    if file.suffix == f'.{output_format}':
-                        downloaded_file = file
-                        break
+            info = extract_and_download(ydl, url, info)
+            downloaded_file = get_downloaded_path(ydl, info, None if trim else output_format)
             
             if downloaded_file:
                 # Apply trimming if specified
-                if start_time or end_time:
+                if trim:
                     trimmed_file = apply_audio_trimming(
                         str(downloaded_file),
                         output_format,
                         start_time,
-                        end_time
+                        end_time,
+                        quality
                     )
                     if trimmed_file:
                         # Remove original file
@@ -95,7 +221,9 @@ def download_youtube_video(
     output_format: str = "mp4",
     quality_preset: str = "medium",
     start_time: Optional[str] = None,
-    end_time: Optional[str] = None
+    end_time: Optional[str] = None,
+    info: Optional[Dict[str, Any]] = None,
+    progress: Optional[Dict[str, float]] = None
 ) -> Optional[str]:
     """
     Download YouTube video in specified format
@@ -106,6 +234,9 @@ def download_youtube_video(
         quality_preset: Video quality preset
         start_time: Start time for trimming (HH:MM:SS)
         end_time: End time for trimming (HH:MM:SS)
+        info: Info dict from an earlier extract_info(url, download=False);
+            reusing it skips a second metadata fetch
+        progress: Mapping to record download progress in (see make_progress_hook)
     
     Returns:
         Path to downloaded video file or None if failed
@@ -119,29 +250,19 @@ def download_youtube_video(
         ydl_opts = YT_DLP_OPTIONS["base"].copy()
         ydl_opts.update({
             'format': 'best[height<=720]/best',  # Limit to 720p for reasonable file size
-            'outtmpl': str(output_dir / '%(title)s.%(ext)s'),
+            'outtmpl': str(output_dir / YOUTUBE_OUTTMPL),
             'quiet': True,
             'no_warnings': True
         })
+        ydl_opts.update(external_downloader_options())
+        
+        if progress is not None:
+            ydl_opts['progress_hooks'] = [make_progress_hook(progress)]
         
         # Download video
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            video_title = info.get('title', 'Unknown')
-            
-            # Find the downloaded file
-            downloaded_file = None
-            for file in output_dir.iterdir():
-                if file.suffix in ['.mp4', '.webm', '.mkv'] and video_title.lower() in file.name.lower():
-                    downloaded_file = file
-                    break
-            
-            if not downloaded_file:
-                # Try to find any video file
-                for file in output_dir.iterdir():
-                    if file.suffix in ['.mp4', '.webm', '.mkv']:
-                        downloaded_file = file
-                        break
+            info = extract_and_download(ydl, url, info)
+            downloaded_file = get_downloaded_path(ydl, info)
             
             if downloaded_file:
                 # Convert to desired format if needed
@@ -187,7 +308,8 @@ def apply_audio_trimming(
     input_path: str,
     output_format: str,
     start_time: Optional[str] = None,
-    end_time: Optional[str] = None
+    end_time: Optional[str] = None,
+    quality: str = "192k"
 ) -> Optional[str]:
     """
     Apply trimming to audio file using FFmpeg
@@ -197,6 +319,7 @@ def apply_audio_trimming(
         output_format: Output audio format
         start_time: Start time (HH:MM:SS)
         end_time: End time (HH:MM:SS)
+        quality: Audio bitrate for lossy output formats
     
     Returns:
         Path to trimmed audio file or None if failed
@@ -216,24 +339,31 @@ def apply_audio_trimming(
             cmd.extend(["-to", end_time])
         
         # Add output options
-        if output_format == "mp3":
-            cmd.extend(["-vn", "-acodec", "libmp3lame", "-ab", "192k"])
+        if output_format == "mp3" and quality in MP3_VBR_QUALITY:
+            cmd.extend(["-vn", "-acodec", "libmp3lame", "-compression_level", MP3_VBR_ALGORITHM_QUALITY,
+                        "-q:a", MP3_VBR_QUALITY[quality]])
+        elif output_format == "mp3":
+            cmd.extend(["-vn", "-acodec", "libmp3lame", "-compression_level", MP3_CBR_ALGORITHM_QUALITY, "-ab", quality])
         elif output_format == "wav":
             cmd.extend(["-vn", "-acodec", "pcm_s16le"])
         elif output_format == "flac":
             cmd.extend(["-vn", "-acodec", "flac"])
+        elif output_format == "aac":
+            cmd.extend(["-vn", "-acodec", aac_encoder(), "-b:a", quality])
+        elif output_format == "ogg":
+            cmd.extend(["-vn", "-acodec", "libvorbis"])
         else:
             cmd.extend(["-vn", "-acodec", "copy"])
         
         cmd.append(str(output_path))
         
         # Run FFmpeg
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        success, stdout, stderr = run_ffmpeg_command(cmd)
         
-        if result.returncode == 0 and output_path.exists():
+        if success and output_path.exists():
             return str(output_path)
         else:
-            print(f"FFmpeg error: {result.stderr}")
+            print(f"FFmpeg error: {stderr}")
             return None
             
     except Exception as e:
@@ -282,15 +412,18 @@ def apply_video_trimming(
         else:
             cmd.extend(["-c:v", "copy", "-c:a", "copy"])
         
+        if output_format in FASTSTART_FORMATS:
+            cmd.extend(["-movflags", "+faststart"])
+        
         cmd.append(str(output_path))
         
         # Run FFmpeg
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        success, stdout, stderr = run_ffmpeg_command(cmd)
         
-        if result.returncode == 0 and output_path.exists():
+        if success and output_path.exists():
             return str(output_path)
         else:
-            print(f"FFmpeg error: {result.stderr}")
+            print(f"FFmpeg error: {stderr}")
             return None
             
     except Exception as e:
@@ -338,15 +471,18 @@ def convert_video_format(
         # Add audio codec
         cmd.extend(["-c:a", "aac"])
         
+        if output_format in FASTSTART_FORMATS:
+            cmd.extend(["-movflags", "+faststart"])
+        
         cmd.append(str(output_path))
         
         # Run FFmpeg
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        success, stdout, stderr = run_ffmpeg_command(cmd)
         
-        if result.returncode == 0 and output_path.exists():
+        if success and output_path.exists():
             return str(output_path)
         else:
-            print(f"FFmpeg error: {result.stderr}")
+            print(f"FFmpeg error: {stderr}")
             return None
             
     except Exception as e: